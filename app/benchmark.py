@@ -0,0 +1,241 @@
+import os
+import time
+import argparse
+import sys
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from cleaning import clean_df, normaliser_colonnes
+from migrer_data import (CSV_DTYPES, conversion, document_columns, documents_from_columns,
+                         natural_key_query, memoire_rss_mb)
+
+# Valeurs plausibles pour les champs à faible cardinalité
+GENDERS = ['Male', 'Female']
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+CONDITIONS = ['Cancer', 'Obesity', 'Diabetes', 'Asthma', 'Hypertension', 'Arthritis']
+ADMISSION_TYPES = ['Urgent', 'Emergency', 'Elective']
+INSURANCES = ['Aetna', 'Blue Cross', 'Cigna', 'UnitedHealthcare', 'Medicare']
+MEDICATIONS = ['Aspirin', 'Ibuprofen', 'Penicillin', 'Paracetamol', 'Lipitor']
+TEST_RESULTS = ['Normal', 'Abnormal', 'Inconclusive']
+
+# Valeurs sales injectées par colonne (casse, espaces, valeurs invalides ou vides)
+DIRTY_VALUES = {
+    'Name': ['', '   '],
+    'Age': ['abc', '', '-5', '150'],
+    'Gender': [' male ', 'FEMALE', ''],
+    'Blood Type': ['a+', ' o- ', ''],
+    'Medical Condition': [' Cancer', 'Diabetes  ', ''],
+    'Date of Admission': ['not a date', '', '2020-13-45'],
+    'Hospital': ['  Hospital 1 ,  ', 'Hospital   2'],
+    'Billing Amount': ['n/a', '', '-'],
+    'Room Number': ['', 'x12'],
+    'Discharge Date': ['', 'unknown'],
+    'Test Results': [' Normal ', '']
+}
+
+def salir_donnees(df, dirty_ratio, seed=42):
+    """Remplacer une proportion dirty_ratio des valeurs de chaque colonne par des valeurs sales"""
+    rng = np.random.default_rng(seed + 1)
+    for column, values in DIRTY_VALUES.items():
+        mask = rng.random(len(df)) < dirty_ratio
+        df.loc[mask, column] = rng.choice(values, int(mask.sum()))
+    return df
+
+def generer_donnees(n_rows, seed=42, dirty_ratio=0.0):
+    """Générer un DataFrame brut au format du CSV source (colonnes texte)"""
+    rng = np.random.default_rng(seed)
+    admission = pd.Timestamp('2019-01-01') + pd.to_timedelta(rng.integers(0, 1800, n_rows), unit='D')
+    discharge = admission + pd.to_timedelta(rng.integers(1, 30, n_rows), unit='D')
+
+    df = pd.DataFrame({
+        'Name': pd.Series(rng.integers(0, n_rows, n_rows)).map(lambda i: f"  patient {i} "),
+        'Age': rng.integers(1, 95, n_rows).astype(str),
+        'Gender': rng.choice(GENDERS, n_rows),
+        'Blood Type': rng.choice(BLOOD_TYPES, n_rows),
+        'Medical Condition': rng.choice(CONDITIONS, n_rows),
+        'Date of Admission': admission.strftime('%Y-%m-%d'),
+        'Doctor': pd.Series(rng.integers(0, 5000, n_rows)).map(lambda i: f"doctor {i}"),
+        'Hospital': pd.Series(rng.integers(0, 500, n_rows)).map(lambda i: f"Hospital {i}, "),
+        'Insurance Provider': rng.choice(INSURANCES, n_rows),
+        'Billing Amount': np.round(rng.uniform(100, 50000, n_rows), 6).astype(str),
+        'Room Number': rng.integers(100, 500, n_rows).astype(str),
+        'Admission Type': rng.choice(ADMISSION_TYPES, n_rows),
+        'Discharge Date': discharge.strftime('%Y-%m-%d'),
+        'Medication': rng.choice(MEDICATIONS, n_rows),
+        'Test Results': rng.choice(TEST_RESULTS, n_rows)
+    })
+    return salir_donnees(df, dirty_ratio, seed) if dirty_ratio else df
+
+def ecrire_csv(csv_file, n_rows, dirty_ratio=0.0, chunk_size=1_000_000):
+    """Écrire un data.csv synthétique par blocs (10M lignes sans tout garder en mémoire)"""
+    for number, start in enumerate(range(0, n_rows, chunk_size)):
+        df = generer_donnees(min(chunk_size, n_rows - start), seed=number, dirty_ratio=dirty_ratio)
+        df.to_csv(csv_file, index=False, header=(number == 0), mode='w' if number == 0 else 'a')
+    return csv_file
+
+def harmonisation_historique(df):
+    """Nettoyage d'origine (chaîne de passes .str avec copie), conservé comme référence"""
+    df_clean = df.copy()
+    df_clean['Name'] = df_clean['Name'].str.strip().str.title()
+    df_clean['Doctor'] = df_clean['Doctor'].str.strip().str.title()
+    df_clean['Hospital'] = df_clean['Hospital'].str.strip().str.replace(r',\s*$', '', regex=True)
+    df_clean['Hospital'] = df_clean['Hospital'].str.replace(r'\s+', ' ', regex=True)
+    text_columns = ['Gender', 'Blood Type', 'Medical Condition',
+                    'Insurance Provider', 'Admission Type', 'Medication', 'Test Results']
+    for col in text_columns:
+        df_clean[col] = df_clean[col].str.strip()
+    df_clean['Age'] = pd.to_numeric(df_clean['Age'], errors='coerce').astype('Int64')
+    df_clean['Room Number'] = pd.to_numeric(df_clean['Room Number'], errors='coerce').astype('Int64')
+    df_clean['Billing Amount'] = pd.to_numeric(df_clean['Billing Amount'], errors='coerce').round(2)
+    df_clean['Date of Admission'] = pd.to_datetime(df_clean['Date of Admission'], errors='coerce')
+    df_clean['Discharge Date'] = pd.to_datetime(df_clean['Discharge Date'], errors='coerce')
+    df_clean['Gender'] = df_clean['Gender'].str.capitalize()
+    df_clean['Blood Type'] = df_clean['Blood Type'].str.upper()
+    return normaliser_colonnes(df_clean)
+
+def bench_nettoyage(total_rows, chunk_size=1_000_000):
+    """Nettoyage historique vs plan compilé, par chunks générés à la volée (mémoire bornée)"""
+    legacy_time = plan_time = 0.0
+    for number, start in enumerate(range(0, total_rows, chunk_size)):
+        raw = generer_donnees(min(chunk_size, total_rows - start), seed=number)
+
+        t0 = time.perf_counter()
+        harmonisation_historique(raw)
+        legacy_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        clean_df(raw, export_path=None)
+        plan_time += time.perf_counter() - t0
+    return legacy_time, plan_time
+
+def bench_conversion_ligne(cleaned_df, batch_size=1000):
+    """Chemin historique : iterrows + conversion() + requête d'upsert par ligne"""
+    start = time.perf_counter()
+    for i in range(0, len(cleaned_df), batch_size):
+        batch = cleaned_df.iloc[i:i + batch_size]
+        for _, row in batch.iterrows():
+            query = {
+                "patient.Name": row["Name"],
+                "patient.Date_of_Admission": pd.to_datetime(row["Date_of_Admission"]),
+                "patient.Doctor": row["Doctor"]
+            }
+            conversion(row)
+    return time.perf_counter() - start
+
+def bench_conversion_vectorisee(cleaned_df, batch_size=1000):
+    """Nouveau chemin : colonnes converties une fois, documents construits par lot"""
+    start = time.perf_counter()
+    columns = document_columns(cleaned_df)
+    created_at = datetime.now()
+    for i in range(0, len(cleaned_df), batch_size):
+        for doc in documents_from_columns(columns, i, i + batch_size, created_at):
+            natural_key_query(doc)
+    return time.perf_counter() - start
+
+def mesure_encodage(csv_file, categorical, batch_size=1000):
+    """Lecture complète, nettoyage puis construction des documents (exécuté dans un processus dédié)"""
+    dtypes = CSV_DTYPES if categorical else {col: str for col in CSV_DTYPES}
+    rss_before, _ = memoire_rss_mb()
+    start = time.perf_counter()
+    # Lecture en un bloc, comme migrer_data.main() sans --chunk-size
+    df = pd.read_csv(csv_file, dtype=dtypes)
+    rss_read, _ = memoire_rss_mb()
+    cleaned = clean_df(df, export_path=None)
+    columns = document_columns(cleaned)
+    rows = 0
+    for i in range(0, len(cleaned), batch_size):
+        rows += len(documents_from_columns(columns, i, i + batch_size))
+    elapsed = time.perf_counter() - start
+    _, peak = memoire_rss_mb()
+    return {"rows": rows, "seconds": elapsed, "read_mb": rss_read - rss_before, "peak_mb": peak - rss_before}
+
+def bench_encodage(n_rows):
+    """Chaînes objet vs catégories internées : RSS et débit, un processus neuf par variante"""
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file = os.path.join(directory, 'data.csv')
+        generer_donnees(n_rows).to_csv(csv_file, index=False)
+
+        results = {}
+        context = multiprocessing.get_context('spawn')
+        for categorical in (False, True):
+            # Processus neuf : le pic RSS de la variante précédente ne fausse pas la mesure
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results[categorical] = executor.submit(mesure_encodage, csv_file, categorical).result()
+
+    for categorical, label in ((False, "🐢 chaînes objet          "), (True, "🚀 catégories internées   ")):
+        r = results[categorical]
+        print(f"{label}: {r['rows'] / r['seconds']:,.0f} lignes/s ({r['seconds']:.2f}s), "
+              f"lecture +{r['read_mb']:.0f} Mo RSS, pic +{r['peak_mb']:.0f} Mo")
+    print(f"📈 Mémoire à la lecture : x{results[False]['read_mb'] / max(results[True]['read_mb'], 1):.1f} moins, "
+          f"pic : x{results[False]['peak_mb'] / max(results[True]['peak_mb'], 1):.1f} moins, "
+          f"débit : x{results[False]['seconds'] / results[True]['seconds']:.1f}")
+    return results
+
+def bench_verification(mongo_uri, csv_file='data.csv'):
+    """Durée de collecte des métriques du vérificateur : requêtes séparées vs $facet unique"""
+    from verify_migration import MigrationVerifier
+
+    timings = {}
+    for single_pass in (False, True):
+        verifier = MigrationVerifier(mongo_uri, csv_file, single_pass=single_pass)
+        if not verifier.connect_to_mongo():
+            return None
+        try:
+            start = time.perf_counter()
+            verifier.collect_metrics()
+            timings[single_pass] = time.perf_counter() - start
+        finally:
+            verifier.close_connection()
+
+    print(f"🐢 Vérificateur, requêtes séparées : {timings[False]:.2f}s")
+    print(f"🚀 Vérificateur, 1 passe $facet     : {timings[True]:.2f}s")
+    return timings
+
+def parse_args(argv=None):
+    """Options de la ligne de commande"""
+    parser = argparse.ArgumentParser(description="Benchmark de construction des documents")
+    parser.add_argument('--rows', type=int, default=20000, help="Nombre de lignes synthétiques")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Taille des lots")
+    parser.add_argument('--clean-rows', type=int, default=0,
+                        help="Lignes pour le benchmark de nettoyage (ex. 10000000, 0 = --rows)")
+    parser.add_argument('--encoding-rows', type=int, default=0,
+                        help="Lignes pour la mesure RSS objet vs catégories (0 = --rows)")
+    parser.add_argument('--mongo-uri', default=None,
+                        help="Si fourni, mesure aussi le vérificateur sur cette base")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print(f"🧪 Génération de {args.rows} lignes synthétiques...")
+    cleaned_df = clean_df(generer_donnees(args.rows), export_path=None)
+
+    legacy_time = bench_conversion_ligne(cleaned_df, args.batch_size)
+    vector_time = bench_conversion_vectorisee(cleaned_df, args.batch_size)
+
+    print(f"🐢 iterrows + conversion() : {args.rows / legacy_time:,.0f} lignes/s ({legacy_time:.2f}s)")
+    print(f"🚀 build vectorisé        : {args.rows / vector_time:,.0f} lignes/s ({vector_time:.2f}s)")
+    print(f"📈 Accélération : x{legacy_time / vector_time:.1f}")
+
+    clean_rows = args.clean_rows or args.rows
+    print(f"🧪 Nettoyage de {clean_rows} lignes synthétiques...")
+    legacy_time, plan_time = bench_nettoyage(clean_rows)
+    print(f"🐢 harmonisation historique : {clean_rows / legacy_time:,.0f} lignes/s ({legacy_time:.2f}s)")
+    print(f"🚀 plan de nettoyage compilé : {clean_rows / plan_time:,.0f} lignes/s ({plan_time:.2f}s)")
+    print(f"📈 Accélération : x{legacy_time / plan_time:.1f}")
+
+    encoding_rows = args.encoding_rows or args.rows
+    print(f"🧪 Encodage de {encoding_rows} lignes (lecture -> nettoyage -> documents)...")
+    bench_encodage(encoding_rows)
+
+    if args.mongo_uri:
+        return bench_verification(args.mongo_uri) is not None
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,387 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+import numpy as np
+import pandas as pd
+import bson
+from datetime import datetime, timedelta
+from pymongo import MongoClient, InsertOne
+
+from benchmark import ecrire_csv
+from migrer_data import (CHUNK_SIZE, MODES, read_csv_chunks, prepare_chunk, document_columns,
+                         documents_from_columns, build_operations, memoire_rss_mb)
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+BENCH_DB = 'healthcare_bench'
+BENCH_COLLECTION = 'Patients'
+STAGES = ("clean", "build", "write", "verify", "layouts", "queries")
+# Dispositions de stockage comparées : (disposition, compression des blocs)
+LAYOUT_VARIANTS = [("standard", None), ("compact", None), ("timeseries", None), ("compact", "zstd")]
+# Patients échantillonnés pour les recherches de l'étape queries
+QUERY_SAMPLES = 200
+# Intervalle d'échantillonnage de la mémoire résidente pendant une étape
+RSS_SAMPLE_INTERVAL = 0.005
+
+class MemoryCollection:
+    """Collection en mémoire : encode chaque requête en BSON comme le driver, sans serveur"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            if isinstance(operation, InsertOne):
+                document = operation._doc
+                bson.encode(document)
+                self.documents.setdefault(document['_id'], document)
+            else:
+                bson.encode(operation._filter)
+                bson.encode(operation._doc)
+                self.documents[tuple(map(str, operation._filter.values()))] = operation._doc
+        return None
+
+    def count_documents(self, query):
+        return len(self.documents)
+
+    def drop(self):
+        self.documents.clear()
+
+class RssSampler:
+    """Pic de mémoire résidente pendant une étape (échantillonnage en tâche de fond)"""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.start_rss = self.peak_rss = 0.0
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, memoire_rss_mb()[0])
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = memoire_rss_mb()[0]
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak_rss = max(self.peak_rss, memoire_rss_mb()[0])
+
+def stage_result(rows, seconds, latencies, sampler):
+    """Débit, latences p50/p99 par lot et pic mémoire d'une étape"""
+    p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_s": round(rows / seconds, 1) if seconds else None,
+        "batches": len(latencies),
+        "batch_p50_ms": round(p50 * 1000, 3),
+        "batch_p99_ms": round(p99 * 1000, 3),
+        "peak_rss_mb": round(sampler.peak_rss, 1),
+        "peak_rss_delta_mb": round(sampler.peak_rss - sampler.start_rss, 1)
+    }
+
+def bench_clean(csv_file, chunk_size, batch_size):
+    """Lecture + nettoyage, un lot = un chunk"""
+    rows, latencies = 0, []
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        chunks = read_csv_chunks(csv_file, chunk_size)
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            prepare_chunk(chunk)
+            latencies.append(time.perf_counter() - t0)
+            rows += len(chunk)
+        elapsed = time.perf_counter() - start
+    return stage_result(rows, elapsed, latencies, sampler)
+
+def bench_build(csv_file, chunk_size, batch_size, mode="upsert"):
+    """Construction des documents et des opérations bulk_write (nettoyage non chronométré)"""
+    rows, elapsed, latencies = 0, 0.0, []
+    with RssSampler() as sampler:
+        for chunk in read_csv_chunks(csv_file, chunk_size):
+            cleaned = prepare_chunk(chunk)
+            t0 = time.perf_counter()
+            columns = document_columns(cleaned)
+            for i in range(0, len(cleaned), batch_size):
+                t1 = time.perf_counter()
+                build_operations(documents_from_columns(columns, i, i + batch_size), mode)
+                latencies.append(time.perf_counter() - t1)
+            elapsed += time.perf_counter() - t0
+            rows += len(cleaned)
+    return stage_result(rows, elapsed, latencies, sampler)
+
+def bench_write(collection, csv_file, chunk_size, batch_size, mode="upsert"):
+    """bulk_write lot par lot (nettoyage et construction non chronométrés)"""
+    rows, elapsed, latencies = 0, 0.0, []
+    with RssSampler() as sampler:
+        for chunk in read_csv_chunks(csv_file, chunk_size):
+            columns = document_columns(prepare_chunk(chunk))
+            for i in range(0, len(chunk), batch_size):
+                operations = build_operations(documents_from_columns(columns, i, i + batch_size), mode)
+                t0 = time.perf_counter()
+                collection.bulk_write(operations, ordered=False)
+                latency = time.perf_counter() - t0
+                latencies.append(latency)
+                elapsed += latency
+                rows += len(operations)
+    return stage_result(rows, elapsed, latencies, sampler)
+
+def bench_verify(client, collection, csv_file):
+    """MigrationVerifier sur la collection chargée, un lot = une vérification"""
+    from verify_migration import MigrationVerifier
+
+    verifier = MigrationVerifier(None, csv_file)
+    verifier.client, verifier.db, verifier.collection = client, collection.database, collection
+    checks = [verifier.verify_document_count, verifier.verify_data_structure, verifier.verify_data_types,
+              verifier.verify_data_integrity, verifier.verify_duplicates, verifier.generate_statistics]
+    latencies, timings, skipped = [], {}, {}
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        # Les messages du vérificateur ne polluent pas la sortie JSON
+        with contextlib.redirect_stdout(io.StringIO()):
+            for check in checks:
+                t0 = time.perf_counter()
+                try:
+                    check()
+                except Exception as e:
+                    # Opérateur non supporté (mongomock : $firstN...) : le rapport JSON est conservé
+                    skipped[check.__name__] = f"{type(e).__name__}: {e}"
+                    continue
+                latencies.append(time.perf_counter() - t0)
+                timings[check.__name__] = round(latencies[-1], 4)
+        elapsed = time.perf_counter() - start
+    result = stage_result(collection.count_documents({}), elapsed, latencies, sampler)
+    result["checks_s"] = timings
+    if skipped:
+        result["skipped"] = skipped
+    result["errors"] = len(verifier.errors)
+    return result
+
+def query_calls(queries, patients):
+    """(recherche, appel) pour chaque patient échantillonné : nom, médecin, hôpital sur un mois, période"""
+    calls = []
+    for patient in patients:
+        admission = patient["Date_of_Admission"]
+        month_end = admission + timedelta(days=31)
+        calls += [
+            ("name", lambda p=patient: queries.by_name(p["Name"])),
+            ("doctor", lambda p=patient: queries.by_doctor(p["Doctor"], p["Hospital"])),
+            ("hospital", lambda p=patient, s=admission, e=month_end: queries.by_hospital(p["Hospital"], s, e)),
+            ("admission", lambda s=admission, e=month_end: queries.admitted_between(s, e, page_size=20))
+        ]
+    return calls
+
+def bench_queries(collection, samples=QUERY_SAMPLES):
+    """Latence des lectures de queries.py, cache froid puis cache chaud, un lot = une recherche"""
+    from indexes import build_indexes
+    from queries import PatientQueries
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        build_indexes(collection)
+    patients = [document["patient"] for document in collection.find({}, {"patient": 1}).limit(samples * 2)
+                if all(isinstance(document["patient"].get(field), str) for field in ("Name", "Doctor", "Hospital"))
+                and isinstance(document["patient"].get("Date_of_Admission"), datetime)][:samples]
+    # Compteur generation relu une seule fois : aucune écriture pendant la mesure
+    queries = PatientQueries(collection, check_interval=float('inf'))
+    calls = query_calls(queries, patients)
+
+    results = {}
+    with RssSampler() as sampler:
+        for phase in ("cold", "hot"):
+            latencies = {}
+            for lookup, call in calls:
+                t0 = time.perf_counter()
+                call()
+                latencies.setdefault(lookup, []).append(time.perf_counter() - t0)
+            for lookup, values in latencies.items():
+                p50, p99 = np.percentile(values, [50, 99])
+                entry = results.setdefault(lookup, {"calls": len(values)})
+                entry[f"{phase}_p50_ms"] = round(p50 * 1000, 3)
+                entry[f"{phase}_p99_ms"] = round(p99 * 1000, 3)
+    for entry in results.values():
+        if entry["hot_p50_ms"]:
+            entry["hot_speedup_p50"] = round(entry["cold_p50_ms"] / entry["hot_p50_ms"], 1)
+    return {"patients": len(patients), "cache_hits": queries.cache.hits, "cache_misses": queries.cache.misses,
+            "peak_rss_mb": round(sampler.peak_rss, 1), "lookups": results}
+
+def bench_layouts(client, backend, csv_file, chunk_size, batch_size):
+    """Octets par document (BSON envoyé, stockage sur mongod) et durée de chargement par disposition"""
+    from layouts import METADATA_COLLECTION, layout_operations, prepare_collection
+
+    results = {}
+    for layout, compression in LAYOUT_VARIANTS:
+        name = f"{BENCH_COLLECTION}_{layout}" + (f"_{compression}" if compression else "")
+        database = client[BENCH_DB] if client is not None else None
+        if database is None:
+            if compression:
+                results[name] = {"skipped": "compression mesurable uniquement sur mongod"}
+                continue
+            target = MemoryCollection()
+        else:
+            database.drop_collection(f"{name}_view")
+            database.drop_collection(name)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    target = prepare_collection(database, name, layout, compression)
+            except Exception as e:
+                results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+                continue
+
+        documents, bson_bytes, load_time, latencies = 0, 0, 0.0, []
+        with RssSampler() as sampler:
+            for chunk in read_csv_chunks(csv_file, chunk_size):
+                columns = document_columns(prepare_chunk(chunk))
+                for i in range(0, len(chunk), batch_size):
+                    # Même mode partout (insert) : seule la disposition change
+                    operations = layout_operations(documents_from_columns(columns, i, i + batch_size),
+                                                   layout, "insert")
+                    bson_bytes += sum(len(bson.encode(operation._doc)) for operation in operations)
+                    t0 = time.perf_counter()
+                    target.bulk_write(operations, ordered=False)
+                    latencies.append(time.perf_counter() - t0)
+                    load_time += latencies[-1]
+                    documents += len(operations)
+        result = stage_result(documents, load_time, latencies, sampler)
+        result["bson_bytes_per_doc"] = round(bson_bytes / documents, 1) if documents else None
+        if backend == "mongod":
+            stats = database.command("collStats", name)
+            result["storage_bytes_per_doc"] = round(stats.get("storageSize", 0) / documents, 1) if documents else None
+            result["index_bytes"] = stats.get("totalIndexSize")
+        results[name] = result
+
+        if database is not None:
+            database.drop_collection(f"{name}_view")
+            database.drop_collection(name)
+            database[METADATA_COLLECTION].delete_one({"_id": name})
+    return results
+
+def open_backend(mongo_uri):
+    """(nom, client, collection) : mongod si URI fournie, sinon mongomock, sinon collection en mémoire"""
+    if mongo_uri:
+        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        client.admin.command('ping')
+        return "mongod", client, client[BENCH_DB][BENCH_COLLECTION]
+    if mongomock is not None:
+        client = mongomock.MongoClient()
+        return "mongomock", client, client[BENCH_DB][BENCH_COLLECTION]
+    return "memory", None, MemoryCollection()
+
+def git_commit():
+    """Commit courant, pour comparer les résultats entre commits"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(csv_file, stages=STAGES, chunk_size=CHUNK_SIZE, batch_size=1000, mode="upsert", mongo_uri=None):
+    """Exécuter les étapes demandées et retourner le rapport JSON"""
+    backend, client, collection = open_backend(mongo_uri)
+    report = {
+        "commit": git_commit(),
+        "at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "backend": backend,
+        "csv_file": os.path.abspath(csv_file),
+        "csv_bytes": os.path.getsize(csv_file),
+        "chunk_size": chunk_size,
+        "batch_size": batch_size,
+        "mode": mode,
+        "stages": {}
+    }
+    try:
+        collection.drop()
+        if "clean" in stages:
+            report["stages"]["clean"] = bench_clean(csv_file, chunk_size, batch_size)
+        if "build" in stages:
+            report["stages"]["build"] = bench_build(csv_file, chunk_size, batch_size, mode)
+        if "write" in stages or "verify" in stages or "queries" in stages:
+            write = bench_write(collection, csv_file, chunk_size, batch_size, mode)
+            if "write" in stages:
+                report["stages"]["write"] = write
+        if "verify" in stages:
+            if client is None:
+                # Les agrégations du vérificateur demandent un vrai serveur (ou mongomock)
+                report["stages"]["verify"] = {"skipped": "ni mongod (--mongo-uri) ni mongomock disponible"}
+            else:
+                report["stages"]["verify"] = bench_verify(client, collection, csv_file)
+        if "queries" in stages:
+            if client is None:
+                report["stages"]["queries"] = {"skipped": "ni mongod (--mongo-uri) ni mongomock disponible"}
+            else:
+                report["stages"]["queries"] = bench_queries(collection)
+        if "layouts" in stages:
+            report["stages"]["layouts"] = bench_layouts(client, backend, csv_file, chunk_size, batch_size)
+    finally:
+        collection.drop()
+        if client is not None:
+            client.close()
+    return report
+
+def parse_args(argv=None):
+    """Options de la ligne de commande"""
+    parser = argparse.ArgumentParser(description="Suite de benchmark de la migration (rapport JSON)")
+    parser.add_argument('--rows', type=int, default=100000, help="Lignes du CSV synthétique (1k à 10M)")
+    parser.add_argument('--dirty-ratio', type=float, default=0.05,
+                        help="Proportion de valeurs sales par colonne (0 à 1)")
+    parser.add_argument('--csv', default=None, help="CSV existant à utiliser au lieu d'en générer un")
+    parser.add_argument('--stages', default=",".join(STAGES),
+                        help=f"Étapes à mesurer, séparées par des virgules ({','.join(STAGES)})")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Lignes lues par chunk")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Documents par bulk_write")
+    parser.add_argument('--mode', choices=MODES, default="upsert", help="Opérations générées")
+    parser.add_argument('--mongo-uri', default=None,
+                        help="mongod local (base healthcare_bench) ; sinon mongomock ou collection en mémoire")
+    parser.add_argument('--output', default=None, help="Fichier JSON de sortie (défaut : sortie standard)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"❌ Étapes inconnues : {', '.join(sorted(unknown))}", file=sys.stderr)
+        return False
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file = args.csv
+        if csv_file is None:
+            csv_file = os.path.join(directory, 'data.csv')
+            print(f"🧪 Génération de {args.rows} lignes (valeurs sales : {args.dirty_ratio:.0%})...",
+                  file=sys.stderr)
+            ecrire_csv(csv_file, args.rows, args.dirty_ratio)
+        report = run_suite(csv_file, stages, args.chunk_size, args.batch_size, args.mode, args.mongo_uri)
+    report["rows_requested"] = None if args.csv else args.rows
+    report["dirty_ratio"] = None if args.csv else args.dirty_ratio
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+        print(f"💾 Rapport écrit dans {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
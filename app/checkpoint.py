@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', '.migration_checkpoints')
+# Octets relus juste avant l'offset pour vérifier que le début du fichier n'a pas changé
+FINGERPRINT_BYTES = 64 * 1024
+# Colonnes brutes formant la clé naturelle (avant nettoyage)
+RAW_KEY_COLUMNS = ['Name', 'Date of Admission', 'Doctor']
+
+def row_hashes(df):
+    """Empreintes vectorisées (uint64) de la clé naturelle et du contenu de chaque ligne"""
+    keys = pd.util.hash_pandas_object(df[RAW_KEY_COLUMNS], index=False).to_numpy()
+    contents = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return keys, contents
+
+def file_fingerprint(csv_file, offset):
+    """Empreinte de l'en-tête et des derniers octets avant offset"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(csv_file, 'rb') as f:
+        digest.update(f.readline())
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        digest.update(f.read(min(offset, FINGERPRINT_BYTES)))
+    digest.update(str(offset).encode())
+    return digest.hexdigest()
+
+def last_line_end(csv_file):
+    """Position juste après le dernier retour à la ligne (ignore une ligne en cours d'écriture)"""
+    size = os.path.getsize(csv_file)
+    with open(csv_file, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - FINGERPRINT_BYTES)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return size
+
+class MigrationCheckpoint:
+    """Point de reprise local : offset traité et empreintes par ligne déjà migrées"""
+
+    def __init__(self, csv_file, directory=CHECKPOINT_DIR):
+        self.csv_file = csv_file
+        name = os.path.basename(os.path.abspath(csv_file))
+        self.state_file = os.path.join(directory, f"{name}.json")
+        self.hashes_file = os.path.join(directory, f"{name}.hashes.npy")
+        self.state = {}
+        # Empreinte de contenu indexée par empreinte de clé naturelle
+        self.hashes = pd.Series(dtype='uint64')
+        self.pending = []
+        # Clés rencontrées pendant ce passage : seule la première occurrence d'une clé fait foi
+        from validation import SeenKeys
+        self.pass_keys = SeenKeys()
+
+    def load(self):
+        """Charger le checkpoint existant (False si premier passage)"""
+        if not os.path.exists(self.state_file) or not os.path.exists(self.hashes_file):
+            return False
+        with open(self.state_file) as f:
+            self.state = json.load(f)
+        keys, contents = np.load(self.hashes_file)
+        self.hashes = pd.Series(contents, index=keys)
+        return True
+
+    def resume_offset(self, data_start):
+        """Offset de reprise : fin du dernier passage si le début du fichier est inchangé"""
+        offset = self.state.get('offset', 0)
+        if offset <= data_start or offset > os.path.getsize(self.csv_file):
+            return data_start
+        if file_fingerprint(self.csv_file, offset) != self.state.get('fingerprint'):
+            # Fichier réécrit : relecture complète, seules les lignes modifiées seront envoyées
+            return data_start
+        return offset
+
+    def detect_changes(self, chunk):
+        """Masque des lignes nouvelles ou modifiées depuis le dernier passage"""
+        keys, contents = row_hashes(chunk)
+        positions = self.hashes.index.get_indexer(keys)
+        # Clé inconnue : ligne nouvelle ; clé connue avec un autre contenu : ligne modifiée
+        changed = positions < 0
+        known = ~changed
+        changed[known] = self.hashes.to_numpy()[positions[known]] != contents[known]
+        # Répétition d'une clé dans le passage (première occurrence conservée, comme la validation) :
+        # envoyée seulement si la clé est nouvelle (la validation la met en quarantaine), jamais
+        # enregistrée ; une clé déjà connue répétée a été traitée lors d'un passage précédent
+        repeated = pd.Series(keys).duplicated(keep='first').to_numpy() | self.pass_keys.contains(keys)
+        self.pass_keys.add(keys[~repeated])
+        changed &= ~(repeated & known)
+        first = changed & ~repeated
+        if first.any():
+            self.pending.append((keys[first], contents[first]))
+        return changed
+
+    def save(self, offset):
+        """Enregistrer l'offset traité et fusionner les nouvelles empreintes"""
+        if self.pending:
+            keys = np.concatenate([self.hashes.index.to_numpy(dtype='uint64')] + [k for k, _ in self.pending])
+            contents = np.concatenate([self.hashes.to_numpy(dtype='uint64')] + [c for _, c in self.pending])
+            merged = pd.Series(contents, index=keys)
+            # Les empreintes de ce passage (premières occurrences) remplacent les précédentes :
+            # une ligne modifiée met à jour le document par upsert
+            self.hashes = merged[~merged.index.duplicated(keep='last')]
+            self.pending = []
+
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        self.state = {
+            "csv_file": os.path.abspath(self.csv_file),
+            "offset": offset,
+            "fingerprint": file_fingerprint(self.csv_file, offset),
+            "rows": len(self.hashes),
+            "updated_at": datetime.now().isoformat()
+        }
+        # Écriture atomique : un crash ne laisse jamais un checkpoint à moitié écrit
+        tmp_hashes = self.hashes_file + ".tmp.npy"
+        np.save(tmp_hashes, np.vstack([self.hashes.index.to_numpy(dtype='uint64'),
+                                       self.hashes.to_numpy(dtype='uint64')]))
+        os.replace(tmp_hashes, self.hashes_file)
+        tmp_state = self.state_file + ".tmp"
+        with open(tmp_state, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_state, self.state_file)
@@ -0,0 +1,286 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from checkpoint import CHECKPOINT_DIR
+from cleaning import CLEANING_VERSION, CLEANING_PLAN
+from metrics import METRICS
+from migrer_data import CHUNK_SIZE, CSV_DTYPES, read_csv_chunks, prepare_chunk
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    # Sans pyarrow : colonnes NumPy (.npy) relues en mémoire mappée
+    pa = feather = None
+
+CACHE_DIR = os.path.join(CHECKPOINT_DIR, 'cleaned')
+# Entrées conservées au maximum, les moins récemment utilisées sont supprimées
+MAX_ENTRIES = 4
+HASH_BLOCK = 8 * 1024 * 1024
+DIGESTS_FILE = 'digests.json'
+
+def plan_digest():
+    """Empreinte du plan de nettoyage : une règle modifiée invalide le cache même sans changer la version"""
+    return hashlib.blake2b(repr(CLEANING_PLAN).encode('utf-8'), digest_size=8).hexdigest()
+
+def source_digest(csv_file, directory=CACHE_DIR, compute=True):
+    """Empreinte du contenu du CSV, mémorisée par (taille, date de modification) pour éviter de le relire.
+    compute=False : empreinte mémorisée uniquement (None si le fichier n'a jamais été haché)"""
+    path = os.path.abspath(csv_file)
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    digests_path = os.path.join(directory, DIGESTS_FILE)
+    try:
+        with open(digests_path) as f:
+            digests = json.load(f)
+    except (OSError, ValueError):
+        digests = {}
+    known = digests.get(path)
+    if known and known['signature'] == signature:
+        return known['digest']
+    if not compute:
+        return None
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    digests[path] = {"signature": signature, "digest": digest.hexdigest()}
+    os.makedirs(directory, exist_ok=True)
+    tmp = digests_path + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(digests, f, indent=2)
+    os.replace(tmp, digests_path)
+    return digests[path]['digest']
+
+def save_numpy_layout(df, path):
+    """Une colonne = un ou plusieurs .npy ; le texte est factorisé (codes + valeurs distinctes)"""
+    columns = {}
+    for number, (name, serie) in enumerate(df.items()):
+        prefix = f"c{number}"
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(path, f"{prefix}.codes.npy"), serie.cat.codes.to_numpy())
+            columns[name] = {"kind": "category", "file": prefix,
+                             "categories": serie.cat.categories.tolist()}
+        elif isinstance(serie.dtype, pd.Int64Dtype):
+            np.save(os.path.join(path, f"{prefix}.values.npy"), serie.array._data)
+            np.save(os.path.join(path, f"{prefix}.mask.npy"), serie.array._mask)
+            columns[name] = {"kind": "Int64", "file": prefix}
+        elif serie.dtype == object:
+            codes, uniques = pd.factorize(serie)
+            np.save(os.path.join(path, f"{prefix}.codes.npy"), codes)
+            if all(isinstance(value, str) for value in uniques):
+                # Texte : valeurs distinctes concaténées en UTF-8 + offsets, relues en mémoire mappée
+                encoded = [value.encode('utf-8') for value in uniques]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                offsets[1:] = np.cumsum([len(value) for value in encoded])
+                np.save(os.path.join(path, f"{prefix}.offsets.npy"), offsets)
+                with open(os.path.join(path, f"{prefix}.text.bin"), 'wb') as f:
+                    f.write(b''.join(encoded))
+                columns[name] = {"kind": "text", "file": prefix}
+            else:
+                np.save(os.path.join(path, f"{prefix}.uniques.npy"), np.asarray(uniques, dtype=object),
+                        allow_pickle=True)
+                columns[name] = {"kind": "object", "file": prefix}
+        else:
+            np.save(os.path.join(path, f"{prefix}.values.npy"), serie.to_numpy())
+            columns[name] = {"kind": "numpy", "file": prefix}
+    return columns
+
+def decode_text(prefix, codes):
+    """Valeurs texte des codes demandés : seules les valeurs distinctes utilisées sont décodées"""
+    offsets = np.load(f"{prefix}.offsets.npy", mmap_mode='r')
+    used = np.unique(codes[codes >= 0])
+    values = np.empty(len(used), dtype=object)
+    if len(used):
+        text = np.memmap(f"{prefix}.text.bin", dtype=np.uint8, mode='r') if offsets[-1] else None
+        for i, code in enumerate(used):
+            start, end = offsets[code], offsets[code + 1]
+            values[i] = text[start:end].tobytes().decode('utf-8') if end > start else ''
+    positions = np.where(codes >= 0, np.searchsorted(used, codes), -1)
+    return pd.api.extensions.take(values, positions, allow_fill=True)
+
+def load_numpy_layout(path, columns, start=0, stop=None, uniques=None):
+    """Relecture des lignes [start, stop[, tableaux en mémoire mappée : seule la tranche est lue.
+    uniques : valeurs distinctes des colonnes 'object' déjà chargées (réutilisées d'une tranche à l'autre)"""
+    data = {}
+    uniques = {} if uniques is None else uniques
+    for name, spec in columns.items():
+        prefix = os.path.join(path, spec['file'])
+        if spec['kind'] == "category":
+            codes = np.load(f"{prefix}.codes.npy", mmap_mode='r')[start:stop]
+            data[name] = pd.Categorical.from_codes(codes, categories=spec['categories'])
+        elif spec['kind'] == "Int64":
+            data[name] = pd.arrays.IntegerArray(np.load(f"{prefix}.values.npy", mmap_mode='r')[start:stop],
+                                                np.load(f"{prefix}.mask.npy", mmap_mode='r')[start:stop])
+        elif spec['kind'] == "text":
+            data[name] = decode_text(prefix, np.load(f"{prefix}.codes.npy", mmap_mode='r')[start:stop])
+        elif spec['kind'] == "object":
+            # Valeurs non textuelles : tableau pickle, chargé entier une fois
+            codes = np.load(f"{prefix}.codes.npy", mmap_mode='r')[start:stop]
+            if name not in uniques:
+                uniques[name] = np.load(f"{prefix}.uniques.npy", allow_pickle=True)
+            data[name] = pd.api.extensions.take(uniques[name], codes, allow_fill=True)
+        else:
+            data[name] = np.load(f"{prefix}.values.npy", mmap_mode='r')[start:stop]
+    rows = len(next(iter(data.values()))) if data else 0
+    return pd.DataFrame(data, index=pd.RangeIndex(start, start + rows), copy=False)
+
+def feather_rows(reader, start, stop):
+    """Lignes [start, stop[ d'un fichier Feather : seuls les record batches concernés sont convertis"""
+    batches, offset = [], 0
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        end = offset + batch.num_rows
+        if end > start and offset < stop:
+            first = max(start, offset)
+            batches.append(batch.slice(first - offset, min(stop, end) - first))
+        offset = end
+        if offset >= stop:
+            break
+    df = pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+class CleanedCache:
+    """Cache du CSV nettoyé, adressé par l'empreinte du fichier source et la version du nettoyage"""
+
+    def __init__(self, csv_file, directory=CACHE_DIR, hash_source=True):
+        # hash_source=False : pas de lecture complète du CSV pour calculer l'empreinte (streaming) ;
+        # sans empreinte mémorisée, l'entrée est considérée absente
+        self.csv_file = csv_file
+        self.directory = directory
+        digest = source_digest(csv_file, directory, compute=hash_source)
+        self.key = f"{digest}-v{CLEANING_VERSION}-{plan_digest()}" if digest else None
+        self.path = os.path.join(directory, self.key) if self.key else None
+        self.meta_file = os.path.join(self.path, 'meta.json') if self.path else None
+
+    def exists(self):
+        """Entrée complète présente (meta.json est écrit en dernier)"""
+        return self.meta_file is not None and os.path.exists(self.meta_file)
+
+    def readable(self):
+        """Entrée présente et lisible (Feather : pyarrow installé)"""
+        return self.exists() and (feather is not None or self.meta()['format'] != "feather")
+
+    def meta(self):
+        """Métadonnées de l'entrée (format, nombre de lignes, colonnes)"""
+        with open(self.meta_file) as f:
+            return json.load(f)
+
+    def load(self):
+        """DataFrame nettoyé, ou None si absent du cache"""
+        if not self.exists():
+            return None
+        meta = self.meta()
+        if meta['format'] == "feather":
+            if feather is None:
+                return None
+            df = feather.read_feather(os.path.join(self.path, 'data.feather'), memory_map=True)
+        else:
+            df = load_numpy_layout(self.path, meta['columns'])
+        # Date d'accès : sert à l'éviction des entrées les moins récemment utilisées
+        os.utime(self.meta_file)
+        return df
+
+    def chunks(self, first_row=0, nrows=None, chunk_size=CHUNK_SIZE):
+        """Tranches de chunk_size lignes lues une à une (mémoire bornée par le chunk, pas par le fichier)"""
+        meta = self.meta()
+        stop = meta['rows'] if nrows is None else min(meta['rows'], first_row + nrows)
+        os.utime(self.meta_file)
+        if meta['format'] == "feather":
+            reader = pa.ipc.open_file(pa.memory_map(os.path.join(self.path, 'data.feather')))
+            for start in range(first_row, stop, chunk_size):
+                yield feather_rows(reader, start, min(start + chunk_size, stop))
+        else:
+            uniques = {}
+            for start in range(first_row, stop, chunk_size):
+                yield load_numpy_layout(self.path, meta['columns'], start, min(start + chunk_size, stop),
+                                        uniques)
+
+    def store(self, df):
+        """Écriture atomique de l'entrée (répertoire temporaire renommé) puis éviction"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        df = df.reset_index(drop=True)
+        meta = {
+            "csv_file": os.path.abspath(self.csv_file),
+            "key": self.key,
+            "rows": len(df),
+            "cleaning_version": CLEANING_VERSION,
+            "created_at": datetime.now().isoformat()
+        }
+        if feather is not None:
+            feather.write_feather(df, os.path.join(tmp_path, 'data.feather'))
+            meta["format"] = "feather"
+        else:
+            meta["columns"] = save_numpy_layout(df, tmp_path)
+            meta["format"] = "numpy"
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(tmp_path, self.path)
+        self.evict()
+
+    def evict(self, max_entries=MAX_ENTRIES):
+        """Supprimer les entrées périmées du même CSV puis les moins récemment utilisées"""
+        source = os.path.abspath(self.csv_file)
+        entries = []
+        for name in os.listdir(self.directory):
+            meta_file = os.path.join(self.directory, name, 'meta.json')
+            if name == self.key or not os.path.exists(meta_file):
+                continue
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if meta.get('csv_file') == source:
+                # Même fichier, autre contenu ou autres règles : l'entrée ne servira plus
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            else:
+                entries.append((os.path.getmtime(meta_file), name))
+        for _, name in sorted(entries, reverse=True)[max(0, max_entries - 1):]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+def load_cleaned(csv_file, use_cache=True):
+    """CSV entier nettoyé, depuis le cache si possible (sinon lecture, nettoyage et mise en cache)"""
+    cache = CleanedCache(csv_file) if use_cache else None
+    if cache is not None:
+        with METRICS.timer("stage", stage="cache_load"):
+            df = cache.load()
+        if df is not None:
+            print(f"⚡ Données nettoyées lues depuis le cache ({len(df)} lignes, {cache.key})")
+            return df
+
+    with METRICS.timer("stage", stage="read"):
+        df = pd.read_csv(csv_file, dtype=CSV_DTYPES)
+    df = prepare_chunk(df)
+    if cache is not None:
+        cache.store(df)
+        print(f"💾 Données nettoyées mises en cache ({cache.key})")
+    return df
+
+def cleaned_chunks(csv_file, chunk_size=CHUNK_SIZE, first_row=0, nrows=None, start_byte=None):
+    """Chunks nettoyés (index = numéro de ligne) : tranches du cache s'il existe, sinon lecture du CSV.
+    Le CSV n'est pas haché ici : le cache n'est utilisé que si l'empreinte est déjà connue."""
+    cache = CleanedCache(csv_file, hash_source=False)
+    if not cache.readable():
+        for chunk in read_csv_chunks(csv_file, chunk_size, first_row=first_row,
+                                     nrows=nrows, start_byte=start_byte):
+            yield prepare_chunk(chunk)
+        return
+
+    yield from cache.chunks(first_row, nrows, chunk_size)
+
+def cleaned_row_count(csv_file):
+    """Nombre de lignes du CSV, lu dans les métadonnées du cache s'il existe"""
+    cache = CleanedCache(csv_file, hash_source=False)
+    if cache.exists():
+        return cache.meta()['rows']
+    return len(pd.read_csv(csv_file, usecols=[0]))
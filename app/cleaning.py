@@ -1,45 +1,142 @@
 import os
+import re
+import numpy as np
 import pandas as pd
 
-def harmonisation(df):
-    
-   df_clean = df.copy()
-    
-    # 1. Normalisation des noms
-    df_clean['Name'] = df_clean['Name'].str.strip().str.title()
-    df_clean['Doctor'] = df_clean['Doctor'].str.strip().str.title()
-    
+TRAILING_COMMA = re.compile(r',\s*$')
+SPACES = re.compile(r'\s+')
+
+# Version des règles de nettoyage : à incrémenter à chaque changement de comportement
+# (invalide les données nettoyées mises en cache, cf. cleaned_cache.py)
+CLEANING_VERSION = 2
+
+# Étapes de nettoyage texte disponibles dans le plan
+TEXT_STEPS = {
+    'strip': str.strip,
+    'title': str.title,
+    'capitalize': str.capitalize,
+    'upper': str.upper,
+    'drop_trailing_comma': lambda value: TRAILING_COMMA.sub('', value),
+    'collapse_spaces': lambda value: SPACES.sub(' ', value)
+}
+
+# Plan de nettoyage déclaratif : (colonne source, colonne cible, type, étapes texte, encodage)
+# La colonne cible porte le nom attendu par migrer_data.conversion() (underscores)
+# Encodage : None = une passe sur toutes les lignes ; 'distinct' = conversion une fois par valeur
+# distincte puis reprojection ; 'category' = idem avec un résultat catégoriel
+CLEANING_PLAN = [
+    # 1. Normalisation des noms (quasi uniques : passe directe)
+    ('Name', 'Name', 'text', ('strip', 'title'), None),
+    ('Doctor', 'Doctor', 'text', ('strip', 'title'), 'distinct'),
     # 2. Nettoyage des hôpitaux
-    df_clean['Hospital'] = df_clean['Hospital'].str.strip().str.replace(r',\s*$', '', regex=True)
-    df_clean['Hospital'] = df_clean['Hospital'].str.replace(r'\s+', ' ', regex=True)
-    
-    # 3. Nettoyage de tous les champs texte
-    text_columns = ['Gender', 'Blood Type', 'Medical Condition', 
-                    'Insurance Provider', 'Admission Type', 'Medication', 'Test Results']
-    for col in text_columns:
-        df_clean[col] = df_clean[col].str.strip()
-    
+    ('Hospital', 'Hospital', 'text', ('strip', 'drop_trailing_comma', 'collapse_spaces'), 'category'),
+    # 3. Champs texte à faible cardinalité (lus en catégories, nettoyés sur les catégories)
+    ('Gender', 'Gender', 'text', ('strip', 'capitalize'), 'category'),
+    ('Blood Type', 'Blood_Type', 'text', ('strip', 'upper'), 'category'),
+    ('Medical Condition', 'Medical_Condition', 'text', ('strip',), 'category'),
+    ('Insurance Provider', 'Insurance_Provider', 'text', ('strip',), 'category'),
+    ('Admission Type', 'Admission_Type', 'text', ('strip',), 'category'),
+    ('Medication', 'Medication', 'text', ('strip',), 'category'),
+    ('Test Results', 'Test_Results', 'text', ('strip',), 'category'),
     # 4. Conversion des types numériques
-    df_clean['Age'] = pd.to_numeric(df_clean['Age'], errors='coerce').astype('Int64')
-    df_clean['Room Number'] = pd.to_numeric(df_clean['Room Number'], errors='coerce').astype('Int64')
-    df_clean['Billing Amount'] = pd.to_numeric(df_clean['Billing Amount'], errors='coerce').round(2)
-    
-    # 5. Conversion des dates
-    df_clean['Date of Admission'] = pd.to_datetime(df_clean['Date of Admission'], errors='coerce')
-    df_clean['Discharge Date'] = pd.to_datetime(df_clean['Discharge Date'], errors='coerce')
-    
-    # 6. Normalisation du genre (capitalisation)
-    df_clean['Gender'] = df_clean['Gender'].str.capitalize()
-    
-    # 7. Normalisation du groupe sanguin (majuscules)
-    df_clean['Blood Type'] = df_clean['Blood Type'].str.upper()
+    ('Age', 'Age', 'int', (), 'distinct'),
+    ('Room Number', 'Room_Number', 'int', (), 'distinct'),
+    ('Billing Amount', 'Billing_Amount', 'amount', (), None),
+    # 5. Conversion des dates (to_datetime met déjà en cache les valeurs répétées)
+    ('Date of Admission', 'Date_of_Admission', 'date', (), None),
+    ('Discharge Date', 'Discharge_Date', 'date', (), None)
+]
+
+def fuse_steps(steps):
+    """Composer les étapes texte en une seule fonction appliquée en une passe"""
+    functions = [TEXT_STEPS[step] for step in steps]
+
+    def clean_value(value):
+        if not isinstance(value, str):
+            return value
+        for function in functions:
+            value = function(value)
+        return value
+    return clean_value
+
+def clean_text(serie, clean_value):
+    """Une seule passe Python sur les valeurs, sans colonne intermédiaire"""
+    values = serie.to_numpy(dtype=object)
+    return pd.Series([clean_value(value) for value in values], index=serie.index, dtype=object)
+
+def distinct_values(serie):
+    """Codes par ligne et valeurs distinctes (NaN -> code -1)"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    return pd.factorize(serie)
 
-    df_clean.to_csv('medical_data_cleaned.csv', index=False)
-    return df_clean    
+def on_distinct(serie, convert):
+    """Conversion appliquée une fois par valeur distincte puis reprojetée sur les lignes"""
+    codes, uniques = distinct_values(serie)
+    converted = convert(pd.Series(uniques, dtype=object))
+    return pd.Series(pd.api.extensions.take(converted.array, codes, allow_fill=True), index=serie.index)
 
-def clean_df(df):
+def clean_categorical(serie, clean_value):
+    """Nettoyage sur les valeurs distinctes puis reprojection sur les lignes (résultat catégoriel)"""
+    codes, uniques = distinct_values(serie)
+    cleaned = [clean_value(value) for value in uniques]
+    # Deux valeurs brutes peuvent donner la même valeur nettoyée ('male ', 'Male')
+    cleaned_codes, categories = pd.factorize(pd.Series(cleaned, dtype=object))
+    new_codes = np.where(codes >= 0, cleaned_codes[codes] if len(cleaned_codes) else -1, -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=categories), index=serie.index)
 
-    df_cleaned = harmonisation(df)
+def compile_plan(plan):
+    """Compiler le plan une seule fois : une fonction de nettoyage par colonne"""
+    compiled = []
+    for source, target, kind, steps, encoding in plan:
+        if kind == 'text':
+            clean_value = fuse_steps(steps)
+            if encoding == 'category':
+                compiled.append((source, target, lambda serie, fn=clean_value: clean_categorical(serie, fn)))
+                continue
+            convert = lambda serie, fn=clean_value: clean_text(serie, fn)
+        elif kind == 'int':
+            convert = lambda serie: pd.to_numeric(serie, errors='coerce').astype('Int64')
+        elif kind == 'amount':
+            convert = lambda serie: pd.to_numeric(serie, errors='coerce').round(2)
+        elif kind == 'date':
+            convert = lambda serie: pd.to_datetime(serie, errors='coerce')
+        else:
+            raise ValueError(f"Type de colonne inconnu dans le plan de nettoyage : {kind}")
 
+        if encoding == 'distinct':
+            apply = lambda serie, convert=convert: on_distinct(serie, convert)
+        else:
+            apply = convert
+        compiled.append((source, target, apply))
+    return compiled
 
+COMPILED_PLAN = compile_plan(CLEANING_PLAN)
+
+def harmonisation(df, export_path='medical_data_cleaned.csv'):
+    """Appliquer le plan compilé colonne par colonne, en place (pas de copie du DataFrame)"""
+    renames = {}
+    for source, target, apply in COMPILED_PLAN:
+        if source not in df.columns:
+            continue
+        df[source] = apply(df[source])
+        if target != source:
+            renames[source] = target
+    df.rename(columns=renames, inplace=True)
+
+    # Export optionnel (désactivé en mode streaming : un fichier par chunk n'a pas de sens)
+    if export_path:
+        df.to_csv(export_path, index=False)
+    return df
+
+def normaliser_colonnes(df):
+    """Aligner les noms de colonnes hors plan sur ceux attendus par conversion() ('Blood Type' -> 'Blood_Type')"""
+    df.columns = [col.strip().replace(' ', '_') for col in df.columns]
     return df
+
+def clean_df(df, export_path='medical_data_cleaned.csv'):
+
+    df_cleaned = harmonisation(df, export_path=export_path)
+    df_cleaned = normaliser_colonnes(df_cleaned)
+
+    return df_cleaned
@@ -0,0 +1,114 @@
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from migrer_data import DUPLICATE_KEY_ERROR, NATURAL_KEY, NATURAL_KEY_INDEX, natural_key_query
+
+# Index déclarés de la collection Patients
+# write_path : requis par les écritures elles-mêmes (filtre d'upsert), créé avant le chargement
+# unique : deux upserts concurrents d'une même clé ne peuvent pas créer deux documents (le perdant
+# reçoit une erreur 11000 et est rejoué par BulkWritePipeline, il met alors à jour le document)
+DECLARED_INDEXES = [
+    {"name": NATURAL_KEY_INDEX, "keys": [(f"patient.{field}", ASCENDING) for field in NATURAL_KEY],
+     "write_path": True, "unique": True},
+    {"name": "age", "keys": [("patient.Age", ASCENDING)], "write_path": False},
+    {"name": "gender", "keys": [("patient.Gender", ASCENDING)], "write_path": False},
+    # Lectures (queries.py) : clés de tri complétées par _id pour la pagination par clé
+    {"name": "doctor", "keys": [("patient.Doctor", ASCENDING), ("patient.Hospital", ASCENDING),
+                                ("patient.Date_of_Admission", ASCENDING), ("_id", ASCENDING)],
+     "write_path": False},
+    {"name": "hospital", "keys": [("patient.Hospital", ASCENDING), ("patient.Date_of_Admission", ASCENDING),
+                                  ("_id", ASCENDING)], "write_path": False},
+    {"name": "admission", "keys": [("patient.Date_of_Admission", ASCENDING), ("_id", ASCENDING)],
+     "write_path": False}
+]
+
+# Requêtes dont le plan doit utiliser un index : (libellé, filtre construit depuis un document existant)
+PLAN_CHECKS = [
+    ("upsert sur la clé naturelle", lambda sample: natural_key_query(sample)),
+    ("Name manquant", lambda sample: {"patient.Name": {"$in": [None, ""]}}),
+    ("Age manquant", lambda sample: {"patient.Age": None}),
+    ("Age invalide", lambda sample: {"$or": [{"patient.Age": {"$lt": 0}}, {"patient.Age": {"$gt": 120}}]}),
+    ("Gender", lambda sample: {"patient.Gender": sample["patient"].get("Gender")}),
+    ("Patients d'un médecin", lambda sample: {"patient.Doctor": sample["patient"].get("Doctor")}),
+    ("Admissions d'un hôpital", lambda sample: {
+        "patient.Hospital": sample["patient"].get("Hospital"),
+        "patient.Date_of_Admission": {"$gte": sample["patient"].get("Date_of_Admission")}}),
+    ("Période d'admission", lambda sample: {
+        "patient.Date_of_Admission": {"$gte": sample["patient"].get("Date_of_Admission")}})
+]
+
+class QueryPlanError(Exception):
+    """Une requête de la migration ou du vérificateur parcourt toute la collection (COLLSCAN)"""
+
+class IndexBuildError(Exception):
+    """Un index déclaré ne peut pas être construit (index unique sur des doublons déjà en base)"""
+
+def indexes_before_load(mode):
+    """Index à créer avant le chargement : seulement ceux du chemin d'écriture, en mode upsert"""
+    if mode != "upsert":
+        return []
+    return [index["name"] for index in DECLARED_INDEXES if index["write_path"]]
+
+def build_indexes(collection, names=None):
+    """Créer les index déclarés (tous, ou ceux nommés) en une seule commande createIndexes"""
+    declared = [index for index in DECLARED_INDEXES if names is None or index["name"] in names]
+    if not declared:
+        return []
+    existing = collection.index_information()
+    for index in declared:
+        if index.get("unique") and index["name"] in existing and not existing[index["name"]].get("unique"):
+            # Index créé non unique par une version précédente : reconstruit avec la contrainte
+            print(f"🔑 Index {index['name']} non unique : reconstruction")
+            collection.drop_index(index["name"])
+            del existing[index["name"]]
+    missing = [index for index in declared if index["name"] not in existing]
+    if missing:
+        # Un seul parcours de la collection pour construire tous les index manquants
+        try:
+            collection.create_indexes([IndexModel(index["keys"], name=index["name"],
+                                                  unique=index.get("unique", False)) for index in missing])
+        except OperationFailure as e:
+            if e.code != DUPLICATE_KEY_ERROR:
+                raise
+            raise IndexBuildError(f"Index unique impossible, doublons de clé naturelle déjà en base "
+                                 f"(verify_migration.py les liste) : {e}") from e
+    for index in declared:
+        state = "créé" if index in missing else "déjà présent"
+        print(f"🔑 Index {index['name']} {state} ({', '.join(key for key, _ in index['keys'])})")
+    return [index["name"] for index in missing]
+
+def plan_stages(plan):
+    """Noms des étapes d'un plan d'exécution (arbre inputStage / inputStages, moteurs classique et SBE)"""
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        stages += plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+def explain_stages(collection, query):
+    """Étapes du plan gagnant d'un find (verbosité queryPlanner : la requête n'est pas exécutée)"""
+    explain = collection.database.command(
+        "explain", {"find": collection.name, "filter": query}, verbosity="queryPlanner")
+    return plan_stages(explain["queryPlanner"]["winningPlan"])
+
+def check_query_plans(collection, raise_on_collscan=True):
+    """Vérifier que chaque requête déclarée utilise un IXSCAN ; lève QueryPlanError sur un COLLSCAN"""
+    sample = collection.find_one({}, {"patient": 1})
+    if sample is None:
+        print("⚠️ Collection vide : plans d'exécution non vérifiés")
+        return []
+
+    results = []
+    for label, build_query in PLAN_CHECKS:
+        stages = explain_stages(collection, build_query(sample))
+        ok = "IXSCAN" in stages and "COLLSCAN" not in stages
+        results.append((label, stages, ok))
+        print(f"{'✅' if ok else '❌'} Plan « {label} » : {' <- '.join(stages)}")
+
+    regressions = [f"{label} ({' <- '.join(stages)})" for label, stages, ok in results if not ok]
+    if regressions and raise_on_collscan:
+        raise QueryPlanError("Requêtes sans index (COLLSCAN) : " + "; ".join(regressions))
+    return results
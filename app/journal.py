@@ -0,0 +1,114 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+from checkpoint import CHECKPOINT_DIR
+
+# Nombre maximum d'erreurs d'écriture conservées par lot dans le journal
+MAX_LOGGED_WRITE_ERRORS = 20
+
+def error_details(error):
+    """Détails sérialisables d'une erreur bulk_write (BulkWriteError ou autre)"""
+    details = {"type": type(error).__name__, "message": str(error)}
+    bulk_details = getattr(error, 'details', None)
+    if isinstance(bulk_details, dict):
+        write_errors = bulk_details.get('writeErrors', [])
+        details.update({
+            "nInserted": bulk_details.get('nInserted', 0),
+            "nUpserted": bulk_details.get('nUpserted', 0),
+            "writeErrorCount": len(write_errors),
+            # Les documents ('op') ne sont pas conservés : seuls index, code et message
+            "writeErrors": [{"index": e.get('index'), "code": e.get('code'), "errmsg": e.get('errmsg')}
+                            for e in write_errors[:MAX_LOGGED_WRITE_ERRORS]],
+            "writeConcernErrors": [str(e) for e in bulk_details.get('writeConcernErrors', [])]
+        })
+    return details
+
+class MigrationJournal:
+    """Journal durable (JSON lines) des lots écrits et des lots en échec"""
+
+    def __init__(self, csv_file, directory=CHECKPOINT_DIR):
+        self.csv_file = csv_file
+        name = os.path.basename(os.path.abspath(csv_file))
+        self.path = os.path.join(directory, f"{name}.journal.jsonl")
+        self.lock = threading.Lock()
+        self.file = None
+        self.params = {}
+        self.committed = set()
+        self.failed = {}
+
+    def _write(self, event, **fields):
+        """Ajouter un évènement et le forcer sur disque (survit à un crash)"""
+        line = json.dumps({"event": event, "at": datetime.now().isoformat(), **fields}, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def start(self, params):
+        """Nouveau journal pour une migration complète"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'w')
+        self.params = params
+        self.committed = set()
+        self.failed = {}
+        self._write("start", csv_file=os.path.abspath(self.csv_file), **params)
+
+    def load(self):
+        """Relire le journal existant (False s'il n'y en a pas)"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dernière ligne tronquée par un crash
+                    continue
+                batch = (entry.get('start'), entry.get('end'))
+                if entry['event'] == "start":
+                    self.params = {k: v for k, v in entry.items() if k not in ("event", "at", "csv_file")}
+                elif entry['event'] == "committed":
+                    self.committed.add(batch)
+                    self.failed.pop(batch, None)
+                elif entry['event'] == "failed":
+                    self.failed[batch] = entry.get('error')
+        return True
+
+    def reopen(self):
+        """Reprendre l'écriture à la suite du journal existant"""
+        self.file = open(self.path, 'a')
+        self._write("resume", committed=len(self.committed), failed=len(self.failed))
+
+    def resume_row(self):
+        """Première ligne après le préfixe continu de lots déjà traités (écrits ou en échec)"""
+        cursor = 0
+        for start, end in sorted(self.committed | set(self.failed)):
+            if start > cursor:
+                break
+            cursor = max(cursor, end)
+        return cursor
+
+    def failed_ranges(self, before=None):
+        """Plages de lignes des lots en échec jamais réécrits"""
+        return sorted(batch for batch in self.failed
+                      if batch not in self.committed and (before is None or batch[1] <= before))
+
+    def record_committed(self, batch, migrated):
+        """Lot écrit : plage de lignes [start, end)"""
+        self._write("committed", start=batch[0], end=batch[1], migrated=migrated)
+
+    def record_failed(self, batch, error):
+        """Lot en échec après toutes les tentatives, avec le détail de l'erreur"""
+        self._write("failed", start=batch[0], end=batch[1], error=error_details(error))
+
+    def finish(self, total_migrated, errors):
+        """Fin de migration"""
+        self._write("done", migrated=total_migrated, errors=errors)
+
+    def close(self):
+        """Fermer le fichier du journal"""
+        if self.file:
+            self.file.close()
+            self.file = None
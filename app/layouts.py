@@ -0,0 +1,119 @@
+from datetime import datetime
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import CollectionInvalid
+
+from migrer_data import PATIENT_FIELDS, build_operations, document_id
+
+LAYOUTS = ("standard", "compact", "timeseries")
+COMPRESSORS = ("snappy", "zlib", "zstd", "none")
+# Collection des métadonnées de chargement (une entrée par collection au lieu d'un sous-document par patient)
+METADATA_COLLECTION = 'collection_metadata'
+
+# Alias courts des champs patient (disposition compacte et time-series)
+FIELD_ALIASES = {
+    'Name': 'n',
+    'Age': 'a',
+    'Gender': 'g',
+    'Blood_Type': 'bt',
+    'Medical_Condition': 'mc',
+    'Date_of_Admission': 'da',
+    'Doctor': 'd',
+    'Hospital': 'h',
+    'Insurance_Provider': 'ip',
+    'Billing_Amount': 'b',
+    'Room_Number': 'r',
+    'Admission_Type': 'at',
+    'Discharge_Date': 'dd',
+    'Medication': 'm',
+    'Test_Results': 'tr'
+}
+ALIAS_FIELDS = {alias: field for field, alias in FIELD_ALIASES.items()}
+# Time-series : date d'admission en champ temporel, pathologie (faible cardinalité) en champ méta
+TIME_FIELD = FIELD_ALIASES['Date_of_Admission']
+META_FIELD = FIELD_ALIASES['Medical_Condition']
+
+def reader_pipeline(metadata):
+    """Vue de lecture : forme {"patient": {...}, "metadata": {...}} attendue par les lecteurs existants"""
+    return [{"$project": {
+        "_id": 1,
+        "patient": {field: {"$ifNull": [f"${alias}", None]} for field, alias in FIELD_ALIASES.items()},
+        # Métadonnées de la collection, identiques pour tous les documents
+        "metadata": {"$literal": metadata}
+    }}]
+
+def collection_layout(database, name):
+    """Disposition d'une collection ou d'une vue de lecture : (disposition, collection source)"""
+    info = next(database.list_collections(filter={"name": name}), None)
+    source = (info or {}).get("options", {}).get("viewOn", name)
+    entry = database[METADATA_COLLECTION].find_one({"_id": source}, {"layout": 1})
+    return (entry or {}).get("layout", "standard"), source
+
+def default_collection_name(base_name, layout):
+    """Collection cible par défaut : une collection distincte par disposition non standard"""
+    return base_name if layout == "standard" else f"{base_name}_{layout}"
+
+def compact_document(document):
+    """Champs patient sous alias courts, valeurs nulles omises, _id = empreinte de la clé naturelle"""
+    compact = {"_id": document_id(document)}
+    for field, value in document["patient"].items():
+        if value is not None:
+            compact[FIELD_ALIASES[field]] = value
+    return compact
+
+def expand_document(document):
+    """Lecture : document compact -> forme standard {"patient": {...}} (champs absents = None)"""
+    return {"_id": document.get("_id"),
+            "patient": {field: document.get(FIELD_ALIASES[field]) for field in PATIENT_FIELDS}}
+
+def layout_operations(documents, layout="standard", mode="upsert"):
+    """Opérations bulk_write d'un lot selon la disposition de stockage"""
+    if layout == "standard":
+        return build_operations(documents, mode)
+    compact = [compact_document(document) for document in documents]
+    if layout == "timeseries":
+        # Une mesure time-series exige son champ temporel ; pas d'upsert sur ces collections
+        return [InsertOne(document) for document in compact if TIME_FIELD in document]
+    if mode == "insert":
+        return [InsertOne(document) for document in compact]
+    # L'_id porte la clé naturelle : l'upsert passe par l'index _id, sans index supplémentaire
+    return [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in compact]
+
+def collection_options(layout, compression=None):
+    """Options de createCollection : compression des blocs WiredTiger et/ou time-series"""
+    options = {}
+    if compression:
+        options["storageEngine"] = {"wiredTiger": {"configString": f"block_compressor={compression}"}}
+    if layout == "timeseries":
+        options["timeseries"] = {"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": "hours"}
+    return options
+
+def prepare_collection(database, name, layout="standard", compression=None):
+    """Créer la collection avec ses options, la vue de lecture et l'entrée de métadonnées"""
+    options = collection_options(layout, compression)
+    try:
+        database.create_collection(name, **options)
+        print(f"🗃️ Collection {name} créée (disposition {layout}"
+              f"{f', compression {compression}' if compression else ''})")
+    except CollectionInvalid:
+        # Les options de stockage ne s'appliquent qu'à la création
+        if options:
+            print(f"⚠️ Collection {name} déjà existante : options {', '.join(options)} non appliquées")
+
+    metadata = {"created_at": datetime.now(), "created_by": "migrator_service", "version": "1.0"}
+    database[METADATA_COLLECTION].replace_one({"_id": name}, {
+        "_id": name,
+        "layout": layout,
+        "aliases": FIELD_ALIASES if layout != "standard" else None,
+        "compression": compression,
+        "timeseries": options.get("timeseries"),
+        **metadata
+    }, upsert=True)
+
+    if layout != "standard":
+        view_name = f"{name}_view"
+        try:
+            database.create_collection(view_name, viewOn=name, pipeline=reader_pipeline(metadata))
+            print(f"👓 Vue de lecture {view_name} créée (champs patient.* et metadata reconstitués)")
+        except CollectionInvalid:
+            pass
+    return database[name]
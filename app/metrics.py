@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+import contextlib
+from datetime import datetime
+from pymongo import monitoring
+
+PREFIX = 'migration'
+# Bornes (secondes) des histogrammes de durées, au format Prometheus
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, float('inf'))
+TRACEMALLOC_FRAMES = 25
+
+def format_bound(bound):
+    """Borne 'le' d'un bucket Prometheus"""
+    return "+Inf" if bound == float('inf') else repr(bound)
+
+class MetricsRegistry:
+    """Durées (histogrammes) et compteurs par nom et étiquettes, partagés entre threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        """Enregistrer une durée"""
+        key = self._key(name, labels)
+        with self.lock:
+            series = self.timings.get(key)
+            if series is None:
+                series = self.timings[key] = {"count": 0, "sum": 0.0, "max": 0.0,
+                                              "buckets": [0] * len(BUCKETS)}
+            series["count"] += 1
+            series["sum"] += seconds
+            series["max"] = max(series["max"], seconds)
+            for position, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series["buckets"][position] += 1
+                    break
+
+    def increment(self, name, value=1, **labels):
+        """Ajouter à un compteur (lignes lues, documents écrits...)"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Chronométrer un bloc (enregistré même en cas d'exception)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Copie sérialisable (picklable) de toutes les séries"""
+        with self.lock:
+            return {
+                "timings": [(name, list(labels), dict(series, buckets=list(series["buckets"])))
+                            for (name, labels), series in self.timings.items()],
+                "counters": [(name, list(labels), value) for (name, labels), value in self.counters.items()]
+            }
+
+    def merge(self, snapshot):
+        """Ajouter les séries d'un autre processus (shards)"""
+        with self.lock:
+            for name, labels, series in snapshot["timings"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                current = self.timings.setdefault(key, {"count": 0, "sum": 0.0, "max": 0.0,
+                                                        "buckets": [0] * len(BUCKETS)})
+                current["count"] += series["count"]
+                current["sum"] += series["sum"]
+                current["max"] = max(current["max"], series["max"])
+                current["buckets"] = [a + b for a, b in zip(current["buckets"], series["buckets"])]
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        """Vider toutes les séries"""
+        with self.lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def to_json_lines(self):
+        """Une ligne JSON par série"""
+        at = datetime.now().isoformat()
+        lines = []
+        with self.lock:
+            for (name, labels), series in sorted(self.timings.items()):
+                lines.append(json.dumps({
+                    "at": at, "type": "timing", "metric": name, "labels": dict(labels),
+                    "count": series["count"], "sum": round(series["sum"], 6), "max": round(series["max"], 6),
+                    "mean": round(series["sum"] / series["count"], 6) if series["count"] else 0.0,
+                    "buckets": {format_bound(b): n for b, n in zip(BUCKETS, series["buckets"])}
+                }))
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(json.dumps({"at": at, "type": "counter", "metric": name,
+                                         "labels": dict(labels), "value": value}))
+        return lines
+
+    def to_prometheus(self):
+        """Format texte Prometheus (collecteur textfile de node_exporter)"""
+        lines = []
+        with self.lock:
+            by_name = {}
+            for (name, labels), series in self.timings.items():
+                by_name.setdefault(name, []).append((labels, series))
+            for name in sorted(by_name):
+                metric = f"{PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, series in sorted(by_name[name]):
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, series["buckets"]):
+                        cumulative += count
+                        le = f'le="{format_bound(bound)}"'
+                        lines.append(f"{metric}_bucket{{{label_text + ',' if label_text else ''}{le}}} {cumulative}")
+                    lines.append(f"{metric}_sum{{{label_text}}} {series['sum']:.6f}")
+                    lines.append(f"{metric}_count{{{label_text}}} {series['count']}")
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                counters.setdefault(name, []).append((labels, value))
+            for name in sorted(counters):
+                metric = f"{PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in sorted(counters[name]):
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{metric}{{{label_text}}} {value}")
+        return lines
+
+    def export(self, path):
+        """.prom : fichier texte Prometheus (remplacé atomiquement) ; sinon ajout en JSON lines"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if path.endswith('.prom'):
+            tmp = path + ".tmp"
+            with open(tmp, 'w') as f:
+                f.write("\n".join(self.to_prometheus()) + "\n")
+            os.replace(tmp, path)
+        else:
+            with open(path, 'a') as f:
+                f.write("\n".join(self.to_json_lines()) + "\n")
+        print(f"📏 Métriques exportées dans {path}")
+
+    def print_summary(self):
+        """Répartition du temps par étape"""
+        with self.lock:
+            rows = sorted(self.timings.items(), key=lambda item: -item[1]["sum"])
+        if not rows:
+            return
+        print("⏱️ Répartition du temps :")
+        for (name, labels), series in rows:
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            print(f"   {name}[{label_text}] : {series['sum']:.3f}s cumulées, {series['count']} appels, "
+                  f"moyenne {series['sum'] / series['count'] * 1000:.2f}ms, max {series['max'] * 1000:.2f}ms")
+
+METRICS = MetricsRegistry()
+
+class CommandTimer(monitoring.CommandListener):
+    """Aller-retour serveur de chaque commande MongoDB (réseau + exécution côté serveur)"""
+
+    def __init__(self, registry=METRICS):
+        self.registry = registry
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.registry.observe("mongo_command", event.duration_micros / 1e6,
+                              command=event.command_name, status="ok")
+
+    def failed(self, event):
+        self.registry.observe("mongo_command", event.duration_micros / 1e6,
+                              command=event.command_name, status="failed")
+
+@contextlib.contextmanager
+def profiling(profile_path=None, tracemalloc_top=0):
+    """Capture cProfile (thread principal) et/ou tracemalloc autour d'un bloc"""
+    profiler = cProfile.Profile() if profile_path else None
+    if tracemalloc_top:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"🔬 Profil cProfile écrit dans {profile_path} (python -m pstats {profile_path})")
+        if tracemalloc_top:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"🔬 tracemalloc : pic {peak / (1024 * 1024):.1f} Mo, {tracemalloc_top} principales allocations :")
+            for stat in snapshot.statistics('lineno')[:tracemalloc_top]:
+                print(f"   {stat}")
+
+def add_arguments(parser):
+    """Options d'instrumentation communes au migrateur et au vérificateur"""
+    parser.add_argument('--metrics-file', default=os.getenv('METRICS_FILE'),
+                        help="Export des métriques : .prom (Prometheus textfile) ou JSON lines")
+    parser.add_argument('--profile', default=None,
+                        help="Fichier de sortie cProfile (.prof) du thread principal")
+    parser.add_argument('--tracemalloc', type=int, default=0,
+                        help="Afficher les N principales allocations (tracemalloc, ralentit l'exécution)")
+
+@contextlib.contextmanager
+def instrumentation(args):
+    """Profilage optionnel, puis résumé et export des métriques à la fin du bloc"""
+    with profiling(args.profile, args.tracemalloc):
+        try:
+            yield METRICS
+        finally:
+            METRICS.print_summary()
+            if args.metrics_file:
+                METRICS.export(args.metrics_file)
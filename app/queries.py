@@ -0,0 +1,214 @@
+import copy
+import time
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from pymongo.errors import OperationFailure
+
+from metrics import METRICS
+from cleaning import CLEANING_PLAN, fuse_steps
+from stats import STATS_COLLECTION
+
+CACHE_SIZE = 1024
+CACHE_TTL = 60.0
+# Relecture du compteur de lots écrits (collection_stats.generation) au plus une fois par intervalle
+VERSION_CHECK_INTERVAL = 1.0
+PAGE_SIZE = 100
+QUERY_BATCH_SIZE = 1000
+# Projection par défaut : sous-document patient, sans metadata
+PATIENT_PROJECTION = {"patient": 1}
+
+# Paramètres texte nettoyés comme à l'ingestion ("  john smith " -> "John Smith")
+TEXT_CLEANERS = {target: fuse_steps(steps) for _, target, kind, steps, _ in CLEANING_PLAN if kind == 'text'}
+
+# Recherches : index utilisé (hint) et tri = clés de l'index, complétées par _id pour la pagination
+# (natural_key est unique : ses clés suffisent, le tri reste couvert par l'index, sans étape SORT)
+LOOKUPS = {
+    "name": ("natural_key", ("patient.Name", "patient.Date_of_Admission", "patient.Doctor")),
+    "doctor": ("doctor", ("patient.Doctor", "patient.Hospital", "patient.Date_of_Admission", "_id")),
+    "hospital": ("hospital", ("patient.Hospital", "patient.Date_of_Admission", "_id")),
+    "admission": ("admission", ("patient.Date_of_Admission", "_id"))
+}
+
+def text_param(field, value):
+    """Paramètre texte normalisé par les mêmes étapes que le nettoyage du champ"""
+    if not isinstance(value, str):
+        raise TypeError(f"{field} : chaîne attendue, reçu {type(value).__name__}")
+    return TEXT_CLEANERS[field](value)
+
+def date_param(value):
+    """datetime, date ou chaîne ISO 'AAAA-MM-JJ' -> datetime (type stocké des dates)"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    raise TypeError(f"Date attendue (datetime, date ou 'AAAA-MM-JJ'), reçu {type(value).__name__}")
+
+def date_range(start=None, end=None):
+    """Filtre de période [start, end[ (bornes optionnelles)"""
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = date_param(start)
+    if end is not None:
+        bounds["$lt"] = date_param(end)
+    return bounds
+
+def sort_values(document, sort_fields):
+    """Valeurs des clés de tri d'un document (curseur de la page suivante)"""
+    values = []
+    for field in sort_fields:
+        value = document
+        for part in field.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        values.append(value)
+    return tuple(values)
+
+def after_filter(sort_fields, values):
+    """Documents situés après `values` dans l'ordre de tri (pagination par clé, sans skip)"""
+    clauses = []
+    for i, field in enumerate(sort_fields):
+        clause = dict(zip(sort_fields[:i], values[:i]))
+        # null est la plus petite valeur : "après null" = non null
+        clause[field] = {"$ne": None} if values[i] is None else {"$gt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+def projection(fields, sort_fields):
+    """Champs patient demandés, plus les clés de tri nécessaires au curseur"""
+    if not fields:
+        return PATIENT_PROJECTION
+    wanted = {f"patient.{field}": 1 for field in fields}
+    wanted.update({field: 1 for field in sort_fields if field != "_id"})
+    return wanted
+
+class QueryCache:
+    """Résultats récents : LRU borné en nombre d'entrées, chaque entrée expirant après ttl secondes"""
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class PatientQueries:
+    """Lectures de la collection Patients : projections, hints d'index, pages par clé, cache LRU/TTL.
+    Le cache est vidé dès que le migrateur a écrit un lot (compteur generation de collection_stats)."""
+
+    def __init__(self, collection, cache_size=CACHE_SIZE, ttl=CACHE_TTL,
+                 check_interval=VERSION_CHECK_INTERVAL, batch_size=QUERY_BATCH_SIZE):
+        self.collection = collection
+        self.cache = QueryCache(cache_size, ttl)
+        self.check_interval = check_interval
+        self.batch_size = batch_size
+        self.generation = None
+        self.checked_at = None
+        try:
+            # hint uniquement vers un index existant (sinon le serveur refuse la requête)
+            self.indexes = set(collection.index_information())
+        except OperationFailure:
+            self.indexes = set()
+
+    def invalidate(self):
+        """Vider le cache (écriture faite hors du migrateur)"""
+        self.cache.clear()
+
+    def _check_generation(self):
+        """Vider le cache si des lots ont été écrits depuis la dernière vérification"""
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        document = self.collection.database[STATS_COLLECTION].find_one(
+            {"_id": self.collection.name}, {"generation": 1})
+        generation = (document or {}).get("generation")
+        if generation != self.generation:
+            self.cache.clear()
+            self.generation = generation
+
+    def _find(self, lookup, query, fields, page_size, after):
+        """Une page de résultats : {"documents": [...], "next": curseur de la page suivante ou None}"""
+        index, sort_fields = LOOKUPS[lookup]
+        key = (lookup, repr(sorted(query.items())), tuple(fields or ()), page_size, after)
+        self._check_generation()
+        page = self.cache.get(key)
+        if page is not None:
+            METRICS.increment("query_cache", lookup=lookup, result="hit")
+            # Copie : un appelant qui modifie ses documents ne modifie pas le cache
+            return copy.deepcopy(page)
+        METRICS.increment("query_cache", lookup=lookup, result="miss")
+
+        condition = {"$and": [query, after_filter(sort_fields, after)]} if after else query
+        cursor = (self.collection.find(condition, projection(fields, sort_fields))
+                  .sort([(field, 1) for field in sort_fields])
+                  .limit(page_size)
+                  .batch_size(min(page_size, self.batch_size)))
+        if index in self.indexes:
+            cursor = cursor.hint(index)
+        with METRICS.timer("query", lookup=lookup):
+            documents = list(cursor)
+        page = {"documents": documents,
+                "next": sort_values(documents[-1], sort_fields) if len(documents) == page_size else None}
+        self.cache.put(key, page)
+        return copy.deepcopy(page)
+
+    def by_name(self, name, fields=None, page_size=PAGE_SIZE, after=None):
+        """Séjours d'un patient (nom normalisé comme à l'ingestion)"""
+        return self._find("name", {"patient.Name": text_param("Name", name)}, fields, page_size, after)
+
+    def by_doctor(self, doctor, hospital=None, fields=None, page_size=PAGE_SIZE, after=None):
+        """Patients d'un médecin, éventuellement dans un hôpital"""
+        query = {"patient.Doctor": text_param("Doctor", doctor)}
+        if hospital is not None:
+            query["patient.Hospital"] = text_param("Hospital", hospital)
+        return self._find("doctor", query, fields, page_size, after)
+
+    def by_hospital(self, hospital, start=None, end=None, fields=None, page_size=PAGE_SIZE, after=None):
+        """Admissions d'un hôpital, éventuellement sur une période [start, end["""
+        query = {"patient.Hospital": text_param("Hospital", hospital)}
+        if start is not None or end is not None:
+            query["patient.Date_of_Admission"] = date_range(start, end)
+        return self._find("hospital", query, fields, page_size, after)
+
+    def admitted_between(self, start=None, end=None, fields=None, page_size=PAGE_SIZE, after=None):
+        """Admissions sur une période [start, end[, par date d'admission"""
+        bounds = date_range(start, end)
+        query = {"patient.Date_of_Admission": bounds} if bounds else {}
+        return self._find("admission", query, fields, page_size, after)
+
+    def pages(self, lookup, *args, **kwargs):
+        """Toutes les pages d'une recherche (ex. pages(queries.by_hospital, "Hospital 12"))"""
+        after = None
+        while True:
+            page = lookup(*args, after=after, **kwargs)
+            if page["documents"]:
+                yield page["documents"]
+            after = page["next"]
+            if after is None:
+                return
@@ -0,0 +1,119 @@
+import time
+import hashlib
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from migrer_data import (CHUNK_SIZE, PATIENT_FIELDS, NATURAL_KEY,
+                         document_columns, documents_from_columns, document_id)
+from cleaned_cache import cleaned_chunks
+from validation import IngestValidator
+
+# 2^12 = 4096 buckets : un bucket identique des deux côtés n'est jamais comparé ligne à ligne
+BUCKET_BITS = 12
+MONGO_BATCH_SIZE = 5000
+# Exemples de clés affichés par catégorie d'écart
+MAX_REPORTED_KEYS = 10
+
+def canonical(value):
+    """Représentation texte stable d'une valeur, identique côté CSV et côté MongoDB"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def record_digest(patient):
+    """(clé naturelle, empreinte 64 bits de la clé et du contenu) d'un sous-document patient"""
+    key = document_id({"patient": patient})
+    content = "\x1f".join(canonical(patient.get(field)) for field in PATIENT_FIELDS)
+    digest = hashlib.blake2b(f"{key}\x1e{content}".encode('utf-8'), digest_size=8).digest()
+    return key, int.from_bytes(digest, 'little')
+
+def bucket_of(key, bits=BUCKET_BITS):
+    """Bucket d'une clé (préfixe de son empreinte hexadécimale)"""
+    return int(key[:4], 16) >> (16 - bits)
+
+def csv_records(csv_file, chunk_size=CHUNK_SIZE, validate=True):
+    """Sous-documents patient construits depuis le CSV, exactement comme lors de la migration"""
+    # Mêmes règles qu'à l'ingestion (sans fichier de quarantaine) : lignes rejetées exclues
+    validator = IngestValidator(csv_file, path=False) if validate else None
+    for cleaned in cleaned_chunks(csv_file, chunk_size):
+        if validator:
+            cleaned = validator.validate(cleaned)
+        for document in documents_from_columns(document_columns(cleaned)):
+            yield document["patient"]
+
+def mongo_records(collection, batch_size=MONGO_BATCH_SIZE):
+    """Sous-documents patient lus en flux depuis la collection"""
+    cursor = collection.find({}, {"_id": 0, "patient": 1}).batch_size(batch_size)
+    for document in cursor:
+        yield document.get("patient", {})
+
+def bucket_summary(records, bits=BUCKET_BITS):
+    """Nombre d'enregistrements et XOR des empreintes par bucket (indépendant de l'ordre)"""
+    counts = np.zeros(1 << bits, dtype=np.int64)
+    digests = np.zeros(1 << bits, dtype=np.uint64)
+    for patient in records:
+        key, digest = record_digest(patient)
+        bucket = bucket_of(key, bits)
+        counts[bucket] += 1
+        digests[bucket] ^= np.uint64(digest)
+    return counts, digests
+
+def records_in_buckets(records, buckets, bits=BUCKET_BITS):
+    """Empreintes des seuls enregistrements des buckets divergents (la dernière occurrence l'emporte)"""
+    selected = {}
+    duplicates = 0
+    for patient in records:
+        key, digest = record_digest(patient)
+        if bucket_of(key, bits) in buckets:
+            if key in selected:
+                duplicates += 1
+            selected[key] = (digest, tuple(canonical(patient.get(field)) for field in NATURAL_KEY))
+    return selected, duplicates
+
+def reconcile(collection, csv_file, chunk_size=CHUNK_SIZE, bits=BUCKET_BITS, validate=True):
+    """Réconciliation ligne à ligne CSV / MongoDB par empreintes regroupées en buckets"""
+    start = time.time()
+
+    # 1. Résumé par bucket des deux côtés, lus en parallèle
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        csv_future = executor.submit(bucket_summary, csv_records(csv_file, chunk_size, validate), bits)
+        mongo_future = executor.submit(bucket_summary, mongo_records(collection), bits)
+        csv_counts, csv_digests = csv_future.result()
+        mongo_counts, mongo_digests = mongo_future.result()
+
+    divergent = set(np.nonzero((csv_counts != mongo_counts) | (csv_digests != mongo_digests))[0].tolist())
+    report = {
+        "buckets": 1 << bits,
+        "divergent_buckets": len(divergent),
+        "csv_records": int(csv_counts.sum()),
+        "mongo_records": int(mongo_counts.sum()),
+        "missing": [],
+        "extra": [],
+        "mismatched": [],
+        "csv_duplicates": 0,
+        "mongo_duplicates": 0
+    }
+
+    # 2. Comparaison ligne à ligne limitée aux buckets divergents
+    if divergent:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            csv_future = executor.submit(records_in_buckets, csv_records(csv_file, chunk_size, validate), divergent, bits)
+            mongo_future = executor.submit(records_in_buckets, mongo_records(collection), divergent, bits)
+            csv_selected, report["csv_duplicates"] = csv_future.result()
+            mongo_selected, report["mongo_duplicates"] = mongo_future.result()
+
+        for key, (digest, natural_key) in csv_selected.items():
+            if key not in mongo_selected:
+                report["missing"].append(natural_key)
+            elif mongo_selected[key][0] != digest:
+                report["mismatched"].append(natural_key)
+        report["extra"] = [natural_key for key, (_, natural_key) in mongo_selected.items()
+                           if key not in csv_selected]
+
+    report["elapsed"] = time.time() - start
+    return report
@@ -0,0 +1,336 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from checkpoint import CHECKPOINT_DIR
+from metrics import METRICS
+from migrer_data import (CHUNK_SIZE, CSV_DTYPES, DB_NAME, COLLECTION_NAME, WRITE_WORKERS, MAX_IN_FLIGHT,
+                         BulkWritePipeline, submit_batches, prepare_chunk, timed_chunks, wait_for_mongo)
+
+try:
+    # Décompression zstd par pandas (optionnelle)
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Extensions acceptées -> compression passée à pandas (None : fichier lu par mmap)
+SOURCE_SUFFIXES = {".csv": None, ".csv.gz": "gzip", ".csv.zst": "zstd", ".csv.zstd": "zstd"}
+FILE_WORKERS = min(4, os.cpu_count() or 1)
+# Fichiers déjà migrés, cumulés d'une exécution à l'autre
+MANIFEST_FILE = 'ingested_files.json'
+# Clés naturelles écrites par fichier (empreinte uint64 + ligne) : résolution des clés entre fichiers
+KEYS_DIR = os.path.join(CHECKPOINT_DIR, 'ingested_keys')
+
+def compression_of(path):
+    """Compression d'un fichier source d'après son extension"""
+    for suffix, compression in SOURCE_SUFFIXES.items():
+        if path.lower().endswith(suffix):
+            return compression
+    raise ValueError(f"Extension non prise en charge : {path} (attendu {', '.join(SOURCE_SUFFIXES)})")
+
+def is_source(path):
+    return any(path.lower().endswith(suffix) for suffix in SOURCE_SUFFIXES)
+
+def is_multi_source(spec):
+    """Répertoire, motif glob ou fichier compressé : ingestion multi-fichiers"""
+    return os.path.isdir(spec) or glob.has_magic(spec) or (is_source(spec) and compression_of(spec) is not None)
+
+def expand_sources(spec):
+    """Fichiers CSV (compressés ou non) d'un répertoire, d'un motif glob ou d'un chemin, triés"""
+    if os.path.isdir(spec):
+        candidates = [os.path.join(spec, name) for name in os.listdir(spec)]
+    elif glob.has_magic(spec):
+        candidates = glob.glob(spec)
+    else:
+        candidates = [spec]
+    files = sorted(path for path in candidates if os.path.isfile(path) and is_source(path))
+    if not files:
+        raise FileNotFoundError(f"Aucun fichier source pour {spec} ({', '.join(SOURCE_SUFFIXES)})")
+    return files
+
+def source_chunks(path, chunk_size=CHUNK_SIZE):
+    """Chunks bruts d'un fichier : décompression en flux (gzip, zstd) ou lecture par mmap, index = ligne"""
+    compression = compression_of(path)
+    if compression == "zstd" and zstandard is None:
+        raise ImportError(f"{path} : décompression zstd indisponible, installer zstandard")
+    reader = pd.read_csv(path, dtype=CSV_DTYPES, chunksize=chunk_size, compression=compression,
+                         memory_map=compression is None)
+    with reader:
+        row = 0
+        for chunk in timed_chunks(reader):
+            chunk.index = pd.RangeIndex(row, row + len(chunk))
+            row += len(chunk)
+            yield chunk
+
+class IngestManifest:
+    """Fichiers migrés (taille, date de modification, débit, statut) : une relance ne retraite
+    que les fichiers nouveaux, modifiés ou en échec"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CHECKPOINT_DIR, MANIFEST_FILE)
+        self.data = {"files": {}, "runs": []}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+
+    def is_done(self, path):
+        entry = self.data["files"].get(os.path.abspath(path))
+        if entry is None or entry["status"] != "ok":
+            return False
+        stat = os.stat(path)
+        return entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+    def record(self, result):
+        self.data["files"][result["path"]] = {key: value for key, value in result.items()
+                                             if key not in ("path", "metrics")}
+        self.save()
+
+    def record_run(self, summary):
+        self.data["runs"].append(summary)
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=2, default=str)
+        os.replace(tmp, self.path)
+
+def keys_path(path):
+    """Fichier des clés écrites d'un fichier source"""
+    path = os.path.abspath(path)
+    digest = hashlib.blake2b(path.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(KEYS_DIR, f"{os.path.basename(path)}.{digest}.npy")
+
+def save_keys(path, keys, rows):
+    """Clés écrites par un fichier, première occurrence de chaque clé dans le fichier"""
+    keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.uint64)
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    first = ~pd.Series(keys).duplicated(keep='first').to_numpy()
+    os.makedirs(KEYS_DIR, exist_ok=True)
+    np.save(keys_path(path), np.vstack([keys[first], rows[first].astype(np.uint64)]))
+
+def throughput(rows, size, elapsed):
+    """Lignes/s et Mo/s (octets du fichier source, compressés le cas échéant)"""
+    if not elapsed:
+        return None, None
+    return round(rows / elapsed, 1), round(size / (1024 * 1024) / elapsed, 2)
+
+def migrate_file(task):
+    """Worker : lecture, nettoyage, validation et écriture d'un fichier avec son propre client"""
+    path = task['path']
+    label = f"[{os.path.basename(path)}] "
+    start_time = time.time()
+    client = wait_for_mongo(task['mongo_uri'])
+    rows = 0
+    validator = None
+    kept_keys, kept_rows = [], []
+    try:
+        from validation import natural_key_hashes
+        collection = client[DB_NAME][task['collection']]
+        stats = None
+        if task['stats']:
+            from stats import StatsRecorder
+            stats = StatsRecorder(collection)
+        if task['validate']:
+            from validation import IngestValidator, quarantine_path
+            # Quarantaine propre au fichier, remise à zéro à chaque traitement
+            quarantine = quarantine_path(path)
+            if os.path.exists(quarantine):
+                os.remove(quarantine)
+            validator = IngestValidator(path, quarantine, dedup=task['dedup'])
+        pipeline = BulkWritePipeline(collection, task['workers'], task['max_in_flight'], label=label,
+                                     stats=stats)
+        try:
+            for chunk in source_chunks(path, task['chunk_size']):
+                cleaned = prepare_chunk(chunk)
+                if validator:
+                    cleaned = validator.validate(cleaned)
+                kept_keys.append(natural_key_hashes(cleaned))
+                kept_rows.append(cleaned.index.to_numpy(dtype=np.int64))
+                submit_batches(pipeline, cleaned, batch_size=task['batch_size'], mode=task['mode'])
+                rows += len(chunk)
+        finally:
+            pipeline.close()
+    finally:
+        client.close()
+    save_keys(path, kept_keys, kept_rows)
+
+    elapsed = time.time() - start_time
+    rows_per_s, mb_per_s = throughput(rows, task['size'], elapsed)
+    return {
+        "path": path,
+        "status": "ok" if not pipeline.errors else "partial",
+        "size": task['size'],
+        "mtime_ns": task['mtime_ns'],
+        "compression": task['compression'],
+        "rows": rows,
+        "documents": pipeline.total_migrated,
+        "rejected": validator.rows_rejected if validator else 0,
+        "batch_errors": len(pipeline.errors),
+        "elapsed": round(elapsed, 3),
+        "rows_per_s": rows_per_s,
+        "mb_per_s": mb_per_s,
+        "finished_at": datetime.now().isoformat(),
+        # Métriques du processus worker, fusionnées par le coordinateur
+        "metrics": METRICS.snapshot()
+    }
+
+def rewrite_rows(task):
+    """Worker : lignes d'un fichier réécrites par upsert (version la plus récente d'une clé)"""
+    label = f"[{os.path.basename(task['path'])}] "
+    client = wait_for_mongo(task['mongo_uri'])
+    rows = np.asarray(task['rows'])
+    try:
+        pipeline = BulkWritePipeline(client[DB_NAME][task['collection']], task['workers'],
+                                     task['max_in_flight'], label=label)
+        try:
+            for chunk in source_chunks(task['path'], task['chunk_size']):
+                wanted = chunk.index.isin(rows)
+                if wanted.any():
+                    # Copie : le nettoyage en place ne doit pas porter sur une vue du chunk
+                    submit_batches(pipeline, prepare_chunk(chunk[wanted].copy()), batch_size=task['batch_size'],
+                                   mode="upsert")
+        finally:
+            pipeline.close()
+    finally:
+        client.close()
+    return {"path": task['path'], "rewritten": pipeline.total_migrated, "errors": pipeline.errors,
+            "metrics": METRICS.snapshot()}
+
+def resolve_cross_file_keys(files, manifest, processed):
+    """Clés présentes dans plusieurs fichiers : le dernier fichier (ordre des noms) l'emporte.
+    Retourne {fichier: lignes à réécrire} et compte, par fichier, les lignes remplacées (superseded)."""
+    keys, owners, rows = [], [], []
+    done = [os.path.abspath(path) for path in files
+            if manifest.data["files"].get(os.path.abspath(path), {}).get("status") == "ok"
+            and os.path.exists(keys_path(path))]
+    for number, path in enumerate(done):
+        file_keys, file_rows = np.load(keys_path(path))
+        keys.append(file_keys)
+        rows.append(file_rows.astype(np.int64))
+        owners.append(np.full(len(file_keys), number))
+    if not keys:
+        return {}
+    keys, owners, rows = np.concatenate(keys), np.concatenate(owners), np.concatenate(rows)
+    superseded = pd.Series(keys).duplicated(keep='last').to_numpy()
+    for number, path in enumerate(done):
+        manifest.data["files"][path]["superseded"] = int((superseded & (owners == number)).sum())
+    manifest.save()
+    if not superseded.any():
+        return {}
+    # Dernière occurrence d'une clé répétée, réécrite si l'un de ses fichiers vient d'être traité
+    # (écritures parallèles : l'ordre d'arrivée n'est pas l'ordre des fichiers)
+    touched = np.isin(owners, [number for number, path in enumerate(done) if path in processed])
+    latest = ~superseded & np.isin(keys, keys[superseded]) & np.isin(keys, keys[touched])
+    return {path: rows[latest & (owners == number)] for number, path in enumerate(done)
+            if (latest & (owners == number)).any()}
+
+def migrate_files(mongo_uri, files, file_workers=FILE_WORKERS, chunk_size=CHUNK_SIZE, batch_size=1000,
+                  workers=WRITE_WORKERS, max_in_flight=MAX_IN_FLIGHT, mode="upsert",
+                  collection_name=COLLECTION_NAME, validate=True, dedup=True, stats=True,
+                  reprocess=False, manifest_path=None):
+    """Coordinateur : un processus par fichier (file_workers au plus), débits et manifeste"""
+    manifest = IngestManifest(manifest_path)
+    pending = [path for path in files if reprocess or not manifest.is_done(path)]
+    processes = max(1, min(file_workers, len(pending)))
+    print(f"📚 {len(files)} fichiers sources, {len(files) - len(pending)} déjà migrés ignorés, "
+          f"{len(pending)} à traiter ({processes} en parallèle)")
+    if not pending:
+        return 0
+
+    tasks = []
+    for path in pending:
+        stat = os.stat(path)
+        tasks.append({
+            "path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "compression": compression_of(path) or "mmap", "mongo_uri": mongo_uri,
+            "collection": collection_name, "chunk_size": chunk_size or CHUNK_SIZE, "batch_size": batch_size,
+            "workers": workers, "max_in_flight": max_in_flight, "mode": mode,
+            "validate": validate, "dedup": dedup, "stats": stats
+        })
+
+    start_time = time.time()
+    results = []
+    # spawn : pas de fork d'un MongoClient déjà ouvert dans le processus parent
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = {executor.submit(migrate_file, task): task for task in tasks}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+                METRICS.merge(result.pop("metrics"))
+            except Exception as e:
+                # Fichier illisible ou écriture impossible : les autres fichiers continuent
+                result = {"path": task['path'], "status": "failed", "size": task['size'],
+                          "mtime_ns": task['mtime_ns'], "compression": task['compression'],
+                          "rows": 0, "documents": 0, "error": f"{type(e).__name__}: {e}",
+                          "finished_at": datetime.now().isoformat()}
+            manifest.record(result)
+            results.append(result)
+            name = os.path.basename(result['path'])
+            if result['status'] == "failed":
+                print(f"❌ {name}: {result['error']}")
+            else:
+                print(f"📄 {name} ({result['compression']}): {result['rows']} lignes, {result['documents']} docs, "
+                      f"{result['rejected']} écartées en {result['elapsed']:.2f}s - {result['rows_per_s']} lignes/s, "
+                      f"{result['mb_per_s']} Mo/s")
+
+        # Clés répétées d'un fichier à l'autre : version du dernier fichier réécrite en dernier
+        plan = resolve_cross_file_keys(files, manifest, {task['path'] for task in tasks})
+        rewrites = list(executor.map(rewrite_rows, [{**tasks[0], "path": path, "rows": rows}
+                                                    for path, rows in plan.items()]))
+    for rewrite in rewrites:
+        METRICS.merge(rewrite.pop("metrics"))
+        if rewrite['errors']:
+            # Réécriture incomplète : le fichier est retraité (et ses clés résolues) au prochain passage
+            manifest.data["files"][rewrite['path']]["status"] = "partial"
+            manifest.save()
+    superseded = sum(manifest.data["files"].get(os.path.abspath(path), {}).get("superseded", 0)
+                     for path in files)
+    if rewrites:
+        print(f"🔁 Clés présentes dans plusieurs fichiers : {superseded} lignes remplacées par un fichier "
+              f"plus récent, {sum(rewrite['rewritten'] for rewrite in rewrites)} documents réécrits")
+
+    elapsed = time.time() - start_time
+    total_rows = sum(result['rows'] for result in results)
+    total_migrated = sum(result['documents'] for result in results)
+    failed = [result for result in results if result['status'] != "ok"]
+    failed += [{"path": rewrite['path']} for rewrite in rewrites if rewrite['errors']]
+    rows_per_s, mb_per_s = throughput(total_rows, sum(task['size'] for task in tasks), elapsed)
+    manifest.record_run({
+        "at": datetime.now().isoformat(), "files": len(tasks), "skipped": len(files) - len(pending),
+        "failed": len(failed), "rows": total_rows, "documents": total_migrated, "elapsed": round(elapsed, 3),
+        "rows_per_s": rows_per_s, "mb_per_s": mb_per_s, "file_workers": processes
+    })
+    print(f"✅ {len(tasks)} fichiers: {total_rows} lignes, {total_migrated} docs en {elapsed:.2f}s "
+          f"({rows_per_s} lignes/s, {mb_per_s} Mo/s) - manifeste {manifest.path}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} fichier(s) en échec ou incomplet(s), retraités à la prochaine "
+                           f"exécution : {', '.join(os.path.basename(result['path']) for result in failed)}")
+    return total_migrated
+
+def expected_documents(spec, manifest_path=None):
+    """Documents attendus après une ingestion multi-fichiers, d'après le manifeste : lignes lues,
+    moins les lignes en quarantaine et celles remplacées par un fichier plus récent"""
+    manifest = IngestManifest(manifest_path)
+    totals = {"files": 0, "rows": 0, "rejected": 0, "superseded": 0, "missing": []}
+    for path in expand_sources(spec):
+        entry = manifest.data["files"].get(os.path.abspath(path))
+        if entry is None or entry["status"] != "ok":
+            totals["missing"].append(os.path.basename(path))
+            continue
+        totals["files"] += 1
+        totals["rows"] += entry["rows"]
+        totals["rejected"] += entry.get("rejected", 0)
+        totals["superseded"] += entry.get("superseded", 0)
+    totals["expected"] = totals["rows"] - totals["rejected"] - totals["superseded"]
+    return totals
@@ -0,0 +1,168 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+from migrer_data import NATURAL_KEY
+
+QUARANTINE_DIR = os.getenv('QUARANTINE_DIR', 'quarantine')
+# Codes de rejet, dans l'ordre d'évaluation
+REASONS = ("null_name", "invalid_age", "invalid_dates", "missing_admission", "duplicate_key")
+AGE_MIN, AGE_MAX = 0, 120
+
+def violation_masks(df):
+    """Règles du vérificateur évaluées en masques vectorisés sur un chunk nettoyé"""
+    name = df['Name']
+    age = pd.to_numeric(df['Age'], errors='coerce')
+    admission = pd.to_datetime(df['Date_of_Admission'], errors='coerce')
+    discharge = pd.to_datetime(df['Discharge_Date'], errors='coerce')
+    masks = {
+        "null_name": (name.isna() | name.eq('')).to_numpy(dtype=bool),
+        # Âge manquant : toléré (avertissement côté vérificateur), seul un âge hors bornes est rejeté
+        "invalid_age": ((age < AGE_MIN) | (age > AGE_MAX)).fillna(False).to_numpy(dtype=bool),
+        "invalid_dates": (admission > discharge).fillna(False).to_numpy(dtype=bool),
+        # Date d'admission obligatoire (type date attendu par le vérificateur, champ temporel en time-series)
+        "missing_admission": admission.isna().to_numpy(dtype=bool)
+    }
+    return masks
+
+def quarantine_path(csv_file, shard=None):
+    """Fichier de quarantaine d'un CSV (un par shard : pas d'écriture concurrente entre processus)"""
+    name = os.path.basename(os.path.abspath(csv_file))
+    suffix = f".shard{shard}" if shard is not None else ""
+    return os.path.join(QUARANTINE_DIR, f"{name}{suffix}.quarantine.csv")
+
+def quarantine_files(csv_file):
+    """Fichiers de quarantaine existants d'un CSV (migration simple et shards)"""
+    name = glob.escape(os.path.basename(os.path.abspath(csv_file)))
+    return sorted(glob.glob(os.path.join(QUARANTINE_DIR, f"{name}*.quarantine.csv")))
+
+def clear_quarantine(csv_file):
+    """Supprimer la quarantaine d'une migration précédente (nouvelle migration complète)"""
+    for path in quarantine_files(csv_file):
+        os.remove(path)
+
+def quarantined_row_count(csv_file):
+    """Lignes écartées par la dernière migration : écart attendu entre le CSV et MongoDB"""
+    return sum(len(pd.read_csv(path, usecols=[0])) for path in quarantine_files(csv_file))
+
+def natural_key_hashes(df):
+    """Empreinte uint64 de la clé naturelle de chaque ligne (valeurs nettoyées)"""
+    return pd.util.hash_pandas_object(df[list(NATURAL_KEY)], index=False).to_numpy()
+
+class SeenKeys:
+    """Ensemble d'empreintes déjà écrites : tableaux triés fusionnés par paliers (8 octets par clé)"""
+
+    def __init__(self):
+        self.levels = []
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels)
+
+    def contains(self, hashes):
+        """Masque des empreintes déjà vues"""
+        found = np.zeros(len(hashes), dtype=bool)
+        for level in self.levels:
+            positions = np.searchsorted(level, hashes)
+            positions[positions == len(level)] = 0
+            found |= level[positions] == hashes
+        return found
+
+    def add(self, hashes):
+        """Ajouter des empreintes (sans doublons entre elles ni avec l'existant)"""
+        if not len(hashes):
+            return
+        self.levels.append(np.sort(hashes))
+        # Fusion tant que le dernier palier est au moins aussi grand que le précédent : log(n) paliers
+        while len(self.levels) > 1 and len(self.levels[-1]) >= len(self.levels[-2]):
+            merged = np.concatenate([self.levels.pop(), self.levels.pop()])
+            merged.sort(kind='mergesort')
+            self.levels.append(merged)
+
+class IngestValidator:
+    """Validation de chaque chunk avant écriture : lignes invalides en quarantaine, doublons écartés"""
+
+    def __init__(self, csv_file, path=None, dedup=True):
+        # path=False : contrôle seul, sans fichier de quarantaine (réconciliation)
+        self.quarantine_path = None if path is False else path or quarantine_path(csv_file)
+        self.dedup = dedup
+        self.seen = SeenKeys()
+        self.counts = dict.fromkeys(REASONS, 0)
+        self.rows_checked = 0
+        self.rows_rejected = 0
+        # Ajout à la suite d'un fichier existant ; clear_quarantine avant une migration complète
+        self.header_written = bool(self.quarantine_path) and os.path.exists(self.quarantine_path)
+        if self.quarantine_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.quarantine_path)), exist_ok=True)
+
+    def restart(self):
+        """Repartir de zéro (reprise : les lignes déjà traitées sont revalidées depuis le début du fichier)"""
+        if self.quarantine_path and os.path.exists(self.quarantine_path):
+            os.remove(self.quarantine_path)
+        self.header_written = False
+        self.seen = SeenKeys()
+        self.counts = dict.fromkeys(REASONS, 0)
+        self.rows_checked = 0
+        self.rows_rejected = 0
+
+    def validate(self, chunk):
+        """Lignes valides du chunk (index conservé : numéros de ligne source pour le journal)"""
+        if chunk.empty:
+            return chunk
+        masks = violation_masks(chunk)
+        invalid = np.zeros(len(chunk), dtype=bool)
+        for mask in masks.values():
+            invalid |= mask
+
+        if self.dedup:
+            hashes = natural_key_hashes(chunk)
+            # Seules les lignes valides réservent leur clé ; première occurrence conservée,
+            # dans le chunk puis entre chunks (comme un insert à _id déterministe)
+            valid = np.flatnonzero(~invalid)
+            duplicate = np.zeros(len(chunk), dtype=bool)
+            duplicate[valid] = (pd.Series(hashes[valid]).duplicated(keep='first').to_numpy()
+                                | self.seen.contains(hashes[valid]))
+            masks["duplicate_key"] = duplicate
+            invalid |= duplicate
+            self.seen.add(hashes[~invalid])
+
+        self.rows_checked += len(chunk)
+        rejected = int(invalid.sum())
+        if rejected:
+            self.rows_rejected += rejected
+            for reason, mask in masks.items():
+                self.counts[reason] += int(mask.sum())
+            self._quarantine(chunk, masks, invalid)
+        return chunk[~invalid]
+
+    def reject(self, chunk, reason):
+        """Mettre en quarantaine des lignes écartées après coup (doublons entre shards)"""
+        if chunk.empty:
+            return
+        everything = np.ones(len(chunk), dtype=bool)
+        self.rows_rejected += len(chunk)
+        self.counts[reason] += len(chunk)
+        self._quarantine(chunk, {reason: everything}, everything)
+
+    def _quarantine(self, chunk, masks, invalid):
+        """Ajouter les lignes rejetées au fichier de quarantaine, avec leurs codes de rejet"""
+        if self.quarantine_path is None:
+            return
+        rejected = chunk[invalid]
+        reasons = np.full(len(rejected), "", dtype=object)
+        for reason in REASONS:
+            if reason in masks:
+                flagged = masks[reason][invalid]
+                reasons[flagged] = [f"{r}|{reason}" if r else reason for r in reasons[flagged]]
+        out = rejected.copy()
+        out.insert(0, "reasons", reasons)
+        out.insert(0, "source_row", rejected.index)
+        out.to_csv(self.quarantine_path, mode='a', header=not self.header_written, index=False)
+        self.header_written = True
+
+    def summary(self):
+        """Bilan affiché en fin de migration"""
+        details = ", ".join(f"{reason} {count}" for reason, count in self.counts.items() if count)
+        where = f" -> {self.quarantine_path}" if self.quarantine_path and self.rows_rejected else ""
+        return (f"🧪 Validation : {self.rows_checked} lignes contrôlées, {self.rows_rejected} écartées"
+                f"{f' ({details})' if details else ''}{where}")